@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import logging
+import tempfile
+from optparse import OptionParser
+
+import numpy as np
+
+import geometry
+
+
+
+log = logging.getLogger('bench_read')
+
+
+
+def generate(path, npoints):
+    random = np.random.RandomState(0)
+    geo = geometry.ArrayGeometry()
+    geo.add_points(random.uniform(-180, 180, (npoints, 2)))
+    geo.set_point_attr_int_column("freq", random.randint(1, 4, npoints))
+    geo.set_point_attr_float_column("uv", random.uniform(-1, 1, (npoints, 3)))
+    geo.set_point_attr_string_column("iso2", [
+        "%02d" % v for v in random.randint(0, 250, npoints)])
+    with open(path, "w") as geo_file:
+        geo.write(geo_file)
+
+
+
+def bench(label, function, path):
+    start = time.time()
+    geo = function(path)
+    duration = time.time() - start
+    log.warning("%-12s %8.3fs" % (label, duration))
+    return geo, duration
+
+
+
+def bench_read(npoints):
+    # Points only, like the `*-3d-points.geo` files `compile_json` reads.
+    handle, path = tempfile.mkstemp(suffix=".geo")
+    os.close(handle)
+    try:
+        generate(path, npoints)
+        log.warning("Generated %d points, %d bytes." % (
+            npoints, os.path.getsize(path)))
+        geo_array, array_duration = bench("read_array", geometry.read_array, path)
+        geo_read, read_duration = bench("read", geometry.read, path)
+    finally:
+        os.remove(path)
+
+    assert geo_array.render() == geo_read.render()
+    log.warning("Speedup      %8.1fx" % (read_duration / array_duration))
+
+
+
+def main():
+    log.addHandler(logging.StreamHandler())
+
+    usage = """%prog
+
+Time `geometry.read` against `geometry.read_array` on a generated file.
+"""
+
+    parser = OptionParser(usage=usage)
+    parser.add_option("-p", "--points", action="store", dest="npoints", type="int",
+                      help="Number of points to generate.", default=500000)
+
+    (options, args) = parser.parse_args()
+
+    if args:
+        parser.print_usage()
+        sys.exit(1)
+
+    bench_read(options.npoints)
+    
+    
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import codecs
+import logging
+from optparse import OptionParser
+
+import numpy as np
+
+import geometry
+from geometry import ArrayGeometry
+from measure import ring_ids, segment_ends, arc_lengths
+
+
+
+log = logging.getLogger('borderpoints')
+
+
+
+def prim_codes(border, name, table):
+    # Rank of each prim's string attribute in the sorted `table`.
+    rank = dict((code, i) for i, code in enumerate(table))
+    lookup = np.array([rank[code] for code in border.prim_attr_string_dict[name]],
+                      dtype=np.int64)
+    return lookup[border.prim_attr_array(name)]
+
+
+
+def border_points(border):
+    # Total shared border length (radians on the unit sphere) and
+    # length-weighted midpoint for each pair of countries.
+    geo = ArrayGeometry()
+    if not len(border.prims):
+        return geo
+
+    table = sorted(set(border.prim_attr_string_dict["iso2_left"]) |
+                   set(border.prim_attr_string_dict["iso2_right"]))
+    left = prim_codes(border, "iso2_left", table)
+    right = prim_codes(border, "iso2_right", table)
+    key = np.minimum(left, right) * len(table) + np.maximum(left, right)
+    pairs, pair_ids = np.unique(key, return_inverse=True)
+
+    offsets = border.prim_offsets.array
+    points = border.points[border.prim_vertices.array]
+    start, end = segment_ends(offsets, closed=False)
+    lengths = arc_lengths(points, start, end)
+    midpoints = (points[start, :2] + points[end, :2]) / 2
+    segment_pairs = pair_ids[ring_ids(offsets)[start]]
+
+    count = len(pairs)
+    perimeter = np.bincount(segment_pairs, lengths, minlength=count)
+    uv = np.column_stack([
+        np.bincount(segment_pairs, lengths * midpoints[:, 0], minlength=count),
+        np.bincount(segment_pairs, lengths * midpoints[:, 1], minlength=count),
+    ]) / perimeter[:, None]
+
+    geo.add_points(uv)
+    geo.set_point_attr_string_column("iso2_a", [table[i] for i in pairs // len(table)])
+    geo.set_point_attr_string_column("iso2_b", [table[i] for i in pairs % len(table)])
+    geo.set_point_attr_float_column("perimeter", perimeter)
+    geo.set_point_attr_float_column(
+        "uv", np.column_stack([uv, np.zeros(count)]))
+    log.info("%d borders from %d polylines." % (count, len(border.prims)))
+    return geo
+
+
+
+def borderpoints(border_geo_path, binary_path=None):
+    log.info(border_geo_path)
+    border = geometry.read_any(border_geo_path)
+
+    geo = border_points(border)
+    geo.write(codecs.getwriter("utf-8")(sys.stdout))
+    if binary_path:
+        geo.save(binary_path)
+
+
+
+def main():
+    log.addHandler(logging.StreamHandler())
+
+    usage = """%prog BORDER
+
+BORDER    Border polylines from `bordergeo.py`, as .geo or .npgeo.
+
+Write one point per pair of neighbouring countries with `iso2_a`,
+`iso2_b`, `perimeter` and `uv` attributes, in place of Houdini's
+`border-3d-points.geo`.
+"""
+
+    parser = OptionParser(usage=usage)
+    parser.add_option("-v", "--verbose", action="count", dest="verbose",
+                      help="Print verbose information for debugging.", default=0)
+    parser.add_option("-q", "--quiet", action="count", dest="quiet",
+                      help="Suppress warnings.", default=0)
+    parser.add_option("-b", "--binary", action="store", dest="binary",
+                      help="Also save geometry to a binary sidecar at this path.", default=None)
+
+    (options, args) = parser.parse_args()
+    args = [arg.decode(sys.getfilesystemencoding()) for arg in args]
+
+    log_level = (logging.ERROR, logging.WARNING, logging.INFO, logging.DEBUG,)[
+        max(0, min(3, 1 + options.verbose - options.quiet))]
+
+    log.setLevel(log_level)
+
+    if not len(args) == 1:
+        parser.print_usage()
+        sys.exit(1)
+
+    (border_geo_path, ) = args
+
+    borderpoints(border_geo_path, options.binary)
+    
+    
+
+if __name__ == "__main__":
+    main()
@@ -33,25 +33,39 @@ def row_iter(path):
 
 
 
-def combine(path_list, complete=None, warn=None):
+class IncompleteError(ValueError):
+    pass
+
+
+
+def write_rows(out, rows):
+    for row in rows:
+        out.write((
+            (DELIMITER + u" ").join(row) + "\n"
+        ).encode("utf-8"))
+
+
+
+def combine_rows(row_lists, complete_rows=None, warn=None):
+    # Merge `[key, value, ...]` rows, later lists taking precedence. With
+    # `complete_rows`, only and all of its keys must be given values.
     data = {}
 
-    if complete:
+    if complete_rows is not None:
         names = {}
-        complete_path = path_list.pop(0)
-        for row in row_iter(complete_path):
+        for row in complete_rows:
             names[row[0]] = row[1]
             data[row[0]] = None
 
-    for path in path_list:
-        for row in row_iter(path):
+    for rows in row_lists:
+        for row in rows:
             assert len(row) >= 2
-            if complete and row[0] not in data:
+            if complete_rows is not None and row[0] not in data:
                 log.warning("# '%s' not in complete list." % row[0])
                 continue
             data[row[0]] = row[1]
 
-    if complete:
+    if complete_rows is not None:
         fail = False
         for key in sorted(data.keys()):
             if data[key] is None:
@@ -62,12 +76,24 @@ def combine(path_list, complete=None, warn=None):
                     log.error("%s; ; %s" % (key, names[key]))
                     fail = True
         if fail:
-            sys.exit(1)
+            raise IncompleteError("Values missing from complete list.")
 
-    for key in sorted(data.keys()):
-        sys.stdout.write((
-            (DELIMITER + u" ").join((key, data[key])) + "\n"
-        ).encode("utf-8"))
+    return [[key, data[key]] for key in sorted(data.keys())]
+
+
+
+def combine(path_list, complete=None, warn=None):
+    complete_rows = None
+    if complete:
+        complete_rows = list(row_iter(path_list.pop(0)))
+
+    try:
+        rows = combine_rows(
+            [list(row_iter(path)) for path in path_list], complete_rows, warn)
+    except IncompleteError:
+        sys.exit(1)
+
+    write_rows(sys.stdout, rows)
 
 
 
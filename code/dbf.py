@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+# Attribute columns straight from a shapefile's `.dbf`, without opening
+# the geometry. Records are mapped from the file and only the requested
+# columns are decoded, each as a whole array.
+
+import os
+import struct
+
+import numpy as np
+
+
+
+ENCODING = "utf-8"
+HEADER_SIZE = 32
+FIELD_SIZE = 32
+FIELD_TERMINATOR = "\r"
+VALID = " "
+
+
+
+def dbf_path(path):
+    # The `.dbf` beside a `.shp` (or any other shapefile part).
+    return os.path.splitext(path)[0] + ".dbf"
+
+
+
+def read_header(fp):
+    # Record count, header length, record length and a list of
+    # `(name, type, size, decimals, offset)` for each field, where
+    # `offset` is from the start of the record, after the deletion flag.
+    (count, header_length, record_length) = struct.unpack(
+        "<4xIHH20x", fp.read(HEADER_SIZE))
+
+    fields = []
+    offset = 1
+    for i in range((header_length - HEADER_SIZE - 1) // FIELD_SIZE):
+        (name, type_, size, decimals) = struct.unpack(
+            "<11sc4xBB14x", fp.read(FIELD_SIZE))
+        name = name.split("\0", 1)[0].strip()
+        fields.append((name, type_, size, decimals, offset))
+        offset += size
+
+    if fp.read(1) != FIELD_TERMINATOR:
+        raise ValueError("DBF header lacks its field terminator.")
+
+    return count, header_length, record_length, fields
+
+
+
+def field_names(path):
+    with open(dbf_path(path), "rb") as fp:
+        return [field[0] for field in read_header(fp)[3]]
+
+
+
+def decode_column(raw, type_, encoding=ENCODING):
+    # Numbers as floats with NaN for blanks, everything else as stripped
+    # unicode.
+    if type_ in ("N", "F"):
+        values = np.char.strip(np.char.replace(raw, "*", ""))
+        result = np.empty(len(values), dtype=np.float64)
+        result.fill(np.nan)
+        given = values != ""
+        result[given] = values[given].astype(np.float64)
+        return result
+    return np.char.decode(np.char.strip(raw), encoding)
+
+
+
+def columns(path, names, encoding=ENCODING):
+    # Dict of column arrays for the given field names, skipping deleted
+    # records as `shapefile.Reader.records` does.
+    path = dbf_path(path)
+    with open(path, "rb") as fp:
+        count, header_length, record_length, fields = read_header(fp)
+    index = dict((field[0], field) for field in fields)
+    missing = [name for name in names if name not in index]
+    if missing:
+        raise KeyError("%s has no field %s." % (path, ", ".join(missing)))
+
+    if not count:
+        return dict((name, decode_column(np.array([], dtype="S1"), index[name][1], encoding))
+                    for name in names)
+
+    data = np.memmap(path, dtype=np.uint8, mode="r", offset=header_length,
+                     shape=(count, record_length))
+    kept = data[:, 0] == ord(VALID)
+
+    result = {}
+    for name in names:
+        (name, type_, size, decimals, offset) = index[name]
+        raw = np.ascontiguousarray(data[kept, offset:offset + size])
+        result[name] = decode_column(raw.view("S%d" % size).ravel(), type_, encoding)
+    return result
+
+
+
+def rows(path, names, encoding=ENCODING):
+    # `columns` as lists of Python values, one per record.
+    data = columns(path, names, encoding)
+    return zip(*[data[name].tolist() for name in names])
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+# Columnar binary form of `dots.json` and saved layouts, laid out like
+# the `.npgeo` sidecar: magic, header length, a JSON header, then aligned
+# little-endian arrays that typed arrays or `np.frombuffer` can view
+# directly. Strings are indexes into the header's string table.
+
+import json
+import struct
+
+import numpy as np
+
+
+
+BINARY_MAGIC = "DOTSBIN1"
+BINARY_ALIGN = 16
+NO_STRING = 0xffffffff
+
+JSON_TYPES = {
+    "<f4": "float32",
+    "<u4": "uint32",
+    "<u2": "uint16",
+}
+
+
+
+class StringTable(object):
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+    def add(self, value):
+        if value is None:
+            return NO_STRING
+        if value not in self.index:
+            self.index[value] = len(self.strings)
+            self.strings.append(value)
+        return self.index[value]
+
+    def column(self, values):
+        return np.array([self.add(value) for value in values], dtype="<u4")
+
+
+
+def index_dtype(count):
+    return "<u2" if count <= 0xffff else "<u4"
+
+
+
+def write(fp, header, arrays):
+    header = dict(header)
+    header["arrays"] = []
+    offset = 0
+    for name, array in arrays:
+        header["arrays"].append({
+            "name": name,
+            "dtype": array.dtype.str,
+            "type": JSON_TYPES[array.dtype.str],
+            "length": len(array),
+            "offset": offset,
+        })
+        offset += -(-array.nbytes // BINARY_ALIGN) * BINARY_ALIGN
+    header = json.dumps(header, separators=(",", ":"))
+    if isinstance(header, unicode):
+        header = header.encode("utf-8")
+    start = len(BINARY_MAGIC) + 4 + len(header)
+    padding = -start % BINARY_ALIGN
+
+    fp.write(BINARY_MAGIC)
+    fp.write(struct.pack("<I", len(header) + padding))
+    fp.write(header + " " * padding)
+    for name, array in arrays:
+        data = np.ascontiguousarray(array).tostring()
+        fp.write(data)
+        fp.write("\0" * (-len(data) % BINARY_ALIGN))
+
+
+
+def dump_dots(fp, data):
+    nodes = data["nodes"]
+    links = data["links"]
+    strings = StringTable()
+
+    arrays = [
+        ("code", strings.column([node["code"] for node in nodes])),
+        ("name", strings.column([node["name"] for node in nodes])),
+        ("group", strings.column([node.get("group") for node in nodes])),
+        ("population", np.array([node["population"] for node in nodes], dtype="<u4")),
+        ("x", np.array([node["x"] for node in nodes], dtype="<f4")),
+        ("y", np.array([node["y"] for node in nodes], dtype="<f4")),
+        ("area", np.array([node["area"] for node in nodes], dtype="<f4")),
+        ("perimeter", np.array([node["perimeter"] for node in nodes], dtype="<f4")),
+
+        ("source", np.array([link["source"] for link in links], dtype=index_dtype(len(nodes)))),
+        ("target", np.array([link["target"] for link in links], dtype=index_dtype(len(nodes)))),
+        ("linkPerimeter", np.array([link["perimeter"] for link in links], dtype="<f4")),
+        ("linkX", np.array([link["x"] for link in links], dtype="<f4")),
+        ("linkY", np.array([link["y"] for link in links], dtype="<f4")),
+    ]
+    write(fp, {
+        "kind": "dots",
+        "nodes": len(nodes),
+        "links": len(links),
+        "strings": strings.strings,
+    }, arrays)
+
+
+
+def dump_layout(fp, data):
+    nodes = data["nodes"]
+    strings = StringTable()
+
+    arrays = [
+        ("code", strings.column([node["code"] for node in nodes])),
+        ("name", strings.column([node["name"] for node in nodes])),
+        ("radius", np.array([node["radius"] for node in nodes], dtype="<f4")),
+        ("x", np.array([node["x"] for node in nodes], dtype="<f4")),
+        ("y", np.array([node["y"] for node in nodes], dtype="<f4")),
+    ]
+    write(fp, {
+        "kind": "layout",
+        "nodes": len(nodes),
+        "state": data["state"],
+        "strings": strings.strings,
+    }, arrays)
+
+
+
+def is_binary(path):
+    with open(path, "rb") as fp:
+        return fp.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+
+def read(path):
+    # Header and a dict of read-only arrays mapped from the file.
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    if data[:len(BINARY_MAGIC)].tostring() != BINARY_MAGIC:
+        raise ValueError("%s is not a dots binary file." % path)
+    start = len(BINARY_MAGIC) + 4
+    (length, ) = struct.unpack("<I", data[len(BINARY_MAGIC):start].tostring())
+    header = json.loads(data[start:start + length].tostring())
+    start += length
+
+    arrays = {}
+    for spec in header["arrays"]:
+        dtype = np.dtype(str(spec["dtype"]))
+        offset = start + spec["offset"]
+        arrays[spec["name"]] = data[offset:offset + spec["length"] * dtype.itemsize].view(dtype)
+    return header, arrays
+
+
+
+def load(path):
+    # The same structure as the JSON form, for existing consumers.
+    header, arrays = read(path)
+    strings = header["strings"]
+
+    def text(index):
+        return None if index == NO_STRING else strings[index]
+
+    def columns(*names):
+        return zip(*[arrays[name].tolist() for name in names])
+
+    if header["kind"] == "layout":
+        return {
+            "state": header["state"],
+            "nodes": [
+                {
+                    "code": text(code),
+                    "name": text(name),
+                    "radius": radius,
+                    "x": x,
+                    "y": y,
+                }
+                for code, name, radius, x, y in columns(
+                    "code", "name", "radius", "x", "y")
+            ],
+        }
+
+    codes = [text(code) for code in arrays["code"].tolist()]
+    return {
+        "nodes": [
+            {
+                "code": text(code),
+                "name": text(name),
+                "group": text(group),
+                "population": population,
+                "x": x,
+                "y": y,
+                "area": area,
+                "perimeter": perimeter,
+            }
+            for code, name, group, population, x, y, area, perimeter in columns(
+                "code", "name", "group", "population", "x", "y", "area", "perimeter")
+        ],
+        "links": [
+            {
+                "sourceIso": codes[source],
+                "targetIso": codes[target],
+                "source": source,
+                "target": target,
+                "perimeter": perimeter,
+                "x": x,
+                "y": y,
+            }
+            for source, target, perimeter, x, y in columns(
+                "source", "target", "linkPerimeter", "linkX", "linkY")
+        ],
+    }
+
+
+
+def load_any(path):
+    if is_binary(path):
+        return load(path)
+    with open(path) as fp:
+        return json.load(fp)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import logging
+from optparse import OptionParser
+
+import numpy as np
+
+import layout
+import broadphase
+
+
+
+log = logging.getLogger('bench_collide')
+
+
+
+GROUPS = ("Africa", "Americas", "Asia", "Europe", "Oceania")
+
+
+
+def generate(nnodes):
+    random = np.random.RandomState(0)
+    nodes = [
+        {
+            "code": "%05d" % i,
+            "name": "Node %d" % i,
+            "group": GROUPS[random.randint(len(GROUPS))],
+            "population": float(random.randint(1000, 1000000)),
+            "area": random.uniform(0.0001, 0.1),
+            "perimeter": random.uniform(0.01, 1),
+            "x": random.uniform(-180, 180),
+            "y": random.uniform(-60, 80),
+        }
+        for i in range(nnodes)
+    ]
+    # About three land neighbours per node.
+    source = random.randint(0, nnodes, nnodes * 3 // 2)
+    target = random.randint(0, nnodes, nnodes * 3 // 2)
+    links = [
+        {
+            "source": int(s),
+            "target": int(t),
+            "perimeter": random.uniform(0.001, 0.01),
+        }
+        for s, t in zip(source, target) if s != t
+    ]
+    return {"nodes": nodes, "links": links}
+
+
+
+def bench(simulation, method, repeat):
+    # Time collisions at the target density, where nodes are largest.
+    x, y = simulation.x.copy(), simulation.y.copy()
+    simulation.method = method
+    start = time.time()
+    for i in range(repeat):
+        simulation.x, simulation.y = x.copy(), y.copy()
+        simulation.node_collide()
+    duration = (time.time() - start) / repeat
+    result = simulation.x, simulation.y
+    simulation.x, simulation.y = x, y
+    return result, duration
+
+
+
+def bench_collide(sizes, methods, all_limit, repeat):
+    log.warning("%8s  %s" % ("nodes", "  ".join("%10s" % method for method in methods)))
+    for nnodes in sizes:
+        # Grow the canvas with the node count, as the sea and group padding
+        # are in pixels and would otherwise swamp small dots.
+        scale = max(1, (nnodes / 250.0) ** 0.5)
+        simulation = layout.Layout(generate(nnodes), {
+            "width": layout.DEFAULT_STATE["width"] * scale,
+            "height": layout.DEFAULT_STATE["height"] * scale,
+        })
+        simulation.state["density"] = simulation.state["targetDensity"]
+        simulation.update_land_nodes()
+
+        durations = []
+        reference = None
+        for method in methods:
+            if method == "all" and nnodes > all_limit:
+                durations.append(None)
+                continue
+            result, duration = bench(simulation, method, repeat)
+            if reference is None:
+                reference = result
+            assert np.allclose(result, reference)
+            durations.append(duration)
+
+        log.warning("%8d  %s" % (nnodes, "  ".join(
+            "%9.4fs" % duration if duration is not None else "%10s" % "-"
+            for duration in durations)))
+
+
+
+def main():
+    log.addHandler(logging.StreamHandler())
+
+    usage = """%prog
+
+Time one collision step of the layout with each broadphase method over
+generated graphs of increasing size.
+"""
+
+    parser = OptionParser(usage=usage)
+    parser.add_option("-n", "--nodes", action="append", dest="sizes", type="int",
+                      help="Number of nodes. May be repeated.", default=[])
+    parser.add_option("-a", "--all-limit", action="store", dest="all_limit", type="int",
+                      help="Largest graph to test all pairs on.", default=5000)
+    parser.add_option("-r", "--repeat", action="store", dest="repeat", type="int",
+                      help="Collision steps to average over.", default=3)
+
+    (options, args) = parser.parse_args()
+
+    if args:
+        parser.print_usage()
+        sys.exit(1)
+
+    sizes = options.sizes or [250, 1000, 5000, 20000, 50000]
+    methods = sorted(broadphase.METHODS)
+
+    bench_collide(sizes, methods, options.all_limit, options.repeat)
+
+
+
+if __name__ == "__main__":
+    main()
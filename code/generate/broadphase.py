@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+# Candidate pair search for the layout's collision step. Each function
+# returns arrays `i, j` with `i < j` for every pair of points closer than
+# `distance`; callers still apply their own per-pair test.
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+
+
+# Half of the 3x3 neighbourhood, so each pair of cells is visited once.
+GRID_NEIGHBOURS = ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+
+def all_pairs(x, y, distance):
+    i, j = np.triu_indices(len(x), 1)
+    return within(x, y, i, j, distance)
+
+
+
+def within(x, y, i, j, distance):
+    dx = x[i] - x[j]
+    dy = y[i] - y[j]
+    keep = dx * dx + dy * dy < distance * distance
+    return i[keep], j[keep]
+
+
+
+def expand_ranges(starts, counts):
+    # Concatenated `arange(start, start + count)` for each range.
+    total = counts.sum()
+    offsets = np.cumsum(counts) - counts
+    return np.arange(total) - np.repeat(offsets - starts, counts)
+
+
+
+def grid_pairs(x, y, distance):
+    n = len(x)
+    if n < 2 or not distance > 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    cx = np.floor((x - x.min()) / distance).astype(np.int64)
+    cy = np.floor((y - y.min()) / distance).astype(np.int64)
+    rows = cy.max() + 3  # Padding so neighbour offsets never wrap
+
+    keys = cx * rows + cy + 1
+    order = np.argsort(keys, kind="mergesort")
+    sorted_keys = keys[order]
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+
+    i_list = []
+    j_list = []
+    for dx, dy in GRID_NEIGHBOURS:
+        neighbour = keys + dx * rows + dy
+        starts = np.searchsorted(sorted_keys, neighbour, side="left")
+        ends = np.searchsorted(sorted_keys, neighbour, side="right")
+        if (dx, dy) == (0, 0):
+            # Same cell: only pair with points later in sorted order.
+            starts = rank + 1
+        counts = np.maximum(ends - starts, 0)
+        i = np.repeat(np.arange(n), counts)
+        j = order[expand_ranges(starts, counts)]
+        i, j = within(x, y, i, j, distance)
+        i_list.append(np.minimum(i, j))
+        j_list.append(np.maximum(i, j))
+
+    return np.concatenate(i_list), np.concatenate(j_list)
+
+
+
+def kdtree_pairs(x, y, distance):
+    if len(x) < 2 or not distance > 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    tree = cKDTree(np.column_stack([x, y]))
+    pairs = tree.query_pairs(distance, output_type="ndarray")
+    return within(x, y, pairs[:, 0].astype(np.int64), pairs[:, 1].astype(np.int64), distance)
+
+
+
+METHODS = {
+    "all": all_pairs,
+    "grid": grid_pairs,
+}
+if cKDTree is not None:
+    METHODS["kdtree"] = kdtree_pairs
+
+
+
+def default_method():
+    return "kdtree" if cKDTree is not None else "grid"
+
+
+
+def candidate_pairs(x, y, distance, method=None):
+    i, j = METHODS[method or default_method()](x, y, distance)
+    # Sort so that corrections accumulate in the same order, and layouts
+    # come out the same, whichever method found the pairs.
+    order = np.lexsort((j, i))
+    return i[order], j[order]
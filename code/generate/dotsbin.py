@@ -0,0 +1 @@
+../dotsbin.py
\ No newline at end of file
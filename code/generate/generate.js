@@ -404,6 +404,178 @@ function forceTick (e, d3Node, nodes, state, callback) {
 
 
 
+// Binary Dots
+
+
+
+var DOTS_BINARY_MAGIC = "DOTSBIN1";
+var DOTS_BINARY_TYPES = {
+  "float32": Float32Array,
+  "uint32": Uint32Array,
+  "uint16": Uint16Array
+};
+var NO_STRING = 0xffffffff;
+
+
+
+function decodeUtf8 (bytes) {
+  if (typeof TextDecoder !== "undefined") {
+    return new TextDecoder("utf-8").decode(bytes);
+  }
+  var text = "";
+  for (var i = 0; i < bytes.length; i += 0x8000) {
+    text += String.fromCharCode.apply(null, bytes.subarray(i, i + 0x8000));
+  }
+  return decodeURIComponent(escape(text));
+}
+
+
+
+function readDotsBinary (buffer) {
+  // Header and typed array views onto `buffer`, one per column.
+  var bytes = new Uint8Array(buffer);
+  if (decodeUtf8(bytes.subarray(0, 8)) !== DOTS_BINARY_MAGIC) {
+    throw new Error("Not a dots binary file.");
+  }
+  var length = new DataView(buffer).getUint32(8, true);
+  var header = JSON.parse(decodeUtf8(bytes.subarray(12, 12 + length)));
+  var start = 12 + length;
+  var arrays = {};
+  header.arrays.forEach(function (spec) {
+    arrays[spec.name] = new DOTS_BINARY_TYPES[spec.type](
+      buffer, start + spec.offset, spec.length);
+  });
+  return {
+    "header": header,
+    "arrays": arrays
+  };
+}
+
+
+
+function dotsGraph (dots) {
+  // Node and link objects, as in `dots.json`, for the force layout.
+  var strings = dots.header.strings;
+  var a = dots.arrays;
+  var text = function (index) {
+    return index === NO_STRING ? null : strings[index];
+  };
+  var nodes = [];
+  var links = [];
+  var i;
+
+  for (i = 0; i < dots.header.nodes; i++) {
+    nodes.push({
+      "code": text(a.code[i]),
+      "name": text(a.name[i]),
+      "group": text(a.group[i]),
+      "population": a.population[i],
+      "x": a.x[i],
+      "y": a.y[i],
+      "area": a.area[i],
+      "perimeter": a.perimeter[i]
+    });
+  }
+
+  for (i = 0; i < dots.header.links; i++) {
+    links.push({
+      "sourceIso": nodes[a.source[i]].code,
+      "targetIso": nodes[a.target[i]].code,
+      "source": a.source[i],
+      "target": a.target[i],
+      "perimeter": a.linkPerimeter[i],
+      "x": a.linkX[i],
+      "y": a.linkY[i]
+    });
+  }
+
+  return {
+    "nodes": nodes,
+    "links": links
+  };
+}
+
+
+
+function loadDotsBinary (url, callback) {
+  d3.xhr(url)
+    .responseType("arraybuffer")
+    .get(function (error, request) {
+      if (error) {
+        callback(error);
+        return;
+      }
+      callback(null, dotsGraph(readDotsBinary(request.response)));
+    });
+}
+
+
+
+// Server Simulation
+
+
+
+function initSimulation (url, nodes, state, frameCallback) {
+  // Frames are Float32: ticks, alpha, density, then x, y, radius per node.
+  var socket = new WebSocket(url);
+  socket.binaryType = "arraybuffer";
+
+  var send = function (message) {
+    if (socket.readyState === WebSocket.OPEN) {
+      socket.send(JSON.stringify(message));
+    }
+  };
+
+  socket.onopen = function (e) {
+    console.log("Simulation open");
+    send({"state": state, "command": "reset"});
+  };
+
+  socket.onclose = function (e) {
+    console.log("Simulation closed");
+  };
+
+  socket.onmessage = function (e) {
+    var frame = new Float32Array(e.data);
+    state.ticks = frame[0];
+    state.alpha = frame[1];
+    state.density = frame[2];
+    nodes.forEach(function (d, i) {
+      d.x = frame[3 + i * 3];
+      d.y = frame[4 + i * 3];
+      d.radius = frame[5 + i * 3];
+    });
+    frameCallback();
+  };
+
+  return {
+    "send": send
+  };
+}
+
+
+
+function simulationUrl (fps) {
+  var protocol = window.location.protocol === "https:" ? "wss:" : "ws:";
+  var url = protocol + "//" + window.location.host + "/simulate";
+  if (fps) {
+    url += "?fps=" + fps;
+  }
+  return url;
+}
+
+
+
+function queryValue (name) {
+  var match = new RegExp("[?&]" + name + "(?:=([^&]*))?(&|$)").exec(window.location.search);
+  if (!match) {
+    return null;
+  }
+  return match[1] || "";
+}
+
+
+
 // Form
 
 function initSlider (name, decimalPlaces, state, update) {
@@ -489,7 +661,7 @@ function initForm (stop, resume, reset, save, state, update) {
 
 
 
-d3.json("dots.json", function (error, graph) {
+function main (error, graph) {
   var state = {
     "width": 800,
     "height": 450,
@@ -524,7 +696,11 @@ d3.json("dots.json", function (error, graph) {
     "drawNodes": true,
     "drawLinks": false,
 
-    "restartAlpha": 0.03
+    "restartAlpha": 0.03,
+
+    // Run the simulation on the server, eg. `index.html?server&fps=30`.
+    "serverSimulation": !_.isNull(queryValue("server")),
+    "fps": queryValue("fps")
   }
 
   var svg = d3.select("#dotmap").append("svg")
@@ -637,6 +813,33 @@ d3.json("dots.json", function (error, graph) {
     }
   };
 
+  if (options.serverSimulation) {
+    // Links need node objects to draw, as `force.links` would set.
+    graph.links.forEach(function (link) {
+      link.source = graph.nodes[link.source];
+      link.target = graph.nodes[link.target];
+    });
+
+    var simulation = initSimulation(
+      simulationUrl(options.fps), graph.nodes, state, function () {
+        buttons.$stop.prop("disabled", !state.alpha);
+        buttons.$resume.prop("disabled", !!state.alpha);
+        draw(svg, d3Node, d3Link, options);
+        updateValues(state);
+      });
+
+    initForm(
+      function () { simulation.send({"command": "stop"}); },
+      function () { simulation.send({"command": "resume"}); },
+      function () { simulation.send({"state": state, "command": "reset"}); },
+      buttonSaveCallback, state,
+      function () { simulation.send({"state": state}); });
+
+    draw(svg, d3Node, d3Link, options);
+    console.log("End.");
+    return;
+  }
+
   initForce(force, graph.nodes, graph.links, state,
             forceStartCallback, forceTickCallback, forceEndCallback);
   initForm(buttonStopCallback, buttonResumeCallback, buttonResetCallback, 
@@ -648,4 +851,12 @@ d3.json("dots.json", function (error, graph) {
   force.start();
 
   console.log("End.");
-});
+}
+
+
+
+if (_.isNull(queryValue("binary"))) {
+  d3.json("dots.json", main);
+} else {
+  loadDotsBinary("dots.bin", main);
+}
@@ -0,0 +1,595 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Headless port of the force simulation in `generate.js`, including the
+# parts of d3's v3 force layout it relies on (link springs, charge and
+# Verlet integration), vectorized over node arrays.
+
+import sys
+import json
+import logging
+from optparse import OptionParser
+
+import numpy as np
+
+import dotsbin
+import broadphase
+
+
+
+log = logging.getLogger('layout')
+
+
+
+DEFAULT_STATE = {
+    "width": 800,
+    "height": 450,
+
+    "popScale": 5,
+    "areaScale": 2.5,
+    "sizePower": 0.5,
+
+    "startDensity": 0.05,
+    "targetDensity": 0.4,
+    "stepDensity": 0.002,
+
+    "chargeGain": 0,  # Default -30. Positive: attract, negative: repel.
+    "linkGain": 38.0,  # Default 1
+    "homeGain": 0.8,
+    "homeEvenDensity": 1.0,
+    "frameGain": 3.0,
+    "framePadding": 30.0,
+
+    "seaDistance": 5.0,
+    "groupDistance": 22.0,
+
+    "surface": None,
+    "maxPopulation": None,
+    "maxArea": None,
+    "ticks": None,
+    "alpha": None,
+    "density": None,
+}
+
+DERIVED_KEYS = ("surface", "maxPopulation", "maxArea", "ticks", "alpha", "density")
+
+# d3.layout.force defaults
+FRICTION = 0.9
+START_ALPHA = 0.1
+END_ALPHA = 0.005
+ALPHA_DECAY = 0.99
+
+# `options.restartAlpha` in generate.js
+RESTART_ALPHA = 0.03
+
+# Lower starting alpha for a warm start: 138 ticks rather than 298.
+WARM_ALPHA = 0.02
+
+
+
+def lerp(v1, v2, t):
+    return v1 * (1 - t) + v2 * t
+
+
+
+def even_density(values, mass, lo, hi, octaves):
+    # Split nodes at their mass-weighted center and stretch each side to
+    # fill half of [lo, hi), then repeat within each half for `octaves`
+    # more levels. Levels are done one at a time for all segments, as the
+    # segments at a level evenly divide [lo, hi). Only occupied segments
+    # are numbered, so each level is O(n) however deep it goes.
+    segment = np.zeros(len(values), dtype=np.int64)
+    node_lo = np.empty(len(values))
+    node_lo.fill(lo)
+    for level in range(octaves + 1):
+        segment = np.unique(segment, return_inverse=True)[1]
+        count = segment.max() + 1 if len(segment) else 0
+        w = (hi - lo) / 2.0 ** level / 2.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            center = (np.bincount(segment, values * mass, minlength=count) /
+                      np.bincount(segment, mass, minlength=count))
+            segment_lo = np.zeros(count)
+            segment_lo[segment] = node_lo
+            scale_left = w / (center - segment_lo)
+            scale_right = w / (segment_lo + 2 * w - center)
+
+            node_center = center[segment]
+            is_left = values < node_center
+            values[:] = np.where(
+                is_left,
+                node_lo + (values - node_lo) * scale_left[segment],
+                node_lo + w + (values - node_center) * scale_right[segment])
+
+        node_lo += w * ~is_left
+        segment = segment * 2 + ~is_left
+    return values
+
+
+
+def read_state(path):
+    # Accept either a bare state dict or a saved layout with a "state" key.
+    # Values derived during a run are dropped so the run starts afresh.
+    data = dotsbin.load_any(path)
+    state = dict(data.get("state", data))
+    for key in DERIVED_KEYS:
+        state.pop(key, None)
+    return state
+
+
+
+class Layout(object):
+
+    def __init__(self, graph, state=None, method=None):
+        self.method = method
+        self.state = dict(DEFAULT_STATE)
+        if state:
+            self.state.update(state)
+
+        nodes = graph["nodes"]
+        links = graph["links"]
+
+        self.codes = [node["code"] for node in nodes]
+        self.names = [node["name"] for node in nodes]
+        groups = [node.get("group") for node in nodes]
+        group_index = dict((group, i) for i, group in enumerate(sorted(set(groups))))
+        self.group = np.array([group_index[group] for group in groups], dtype=np.int64)
+
+        self.population = np.array([node["population"] for node in nodes], dtype=np.float64)
+        self.area = np.array([node["area"] for node in nodes], dtype=np.float64)
+        self.perimeter = np.array([node["perimeter"] for node in nodes], dtype=np.float64)
+        self.lon = np.array([node["x"] for node in nodes], dtype=np.float64)
+        self.lat = np.array([node["y"] for node in nodes], dtype=np.float64)
+
+        self.source = np.array([link["source"] for link in links], dtype=np.int64)
+        self.target = np.array([link["target"] for link in links], dtype=np.int64)
+        self.link_perimeter = np.array([link["perimeter"] for link in links], dtype=np.float64)
+
+        self.init_state()
+        self.init_land_nodes()
+        self.init_land_links()
+
+        self.px = self.x.copy()
+        self.py = self.y.copy()
+        self.alpha = START_ALPHA
+        self.fixed = np.zeros(len(self), dtype=bool)
+        self.warm_ticks = 0
+        self.update()
+
+    def __len__(self):
+        return len(self.codes)
+
+    # Init
+
+    def init_state(self):
+        state = self.state
+        state["surface"] = state["width"] * state["height"]
+        state["maxPopulation"] = float(self.population.max()) if len(self) else 0
+        state["maxArea"] = float(self.area.max()) if len(self) else 0
+        self.reset_state()
+
+    def reset_state(self):
+        self.state["density"] = self.state["startDensity"]
+
+    def land_mass(self, max_population=None, max_area=None):
+        state = self.state
+        mass = np.ones(len(self))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mass += state["popScale"] * np.power(
+                self.population / (max_population or state["maxPopulation"]),
+                state["sizePower"])
+            mass += state["areaScale"] * np.power(
+                self.area / (max_area or state["maxArea"]), state["sizePower"])
+        return mass
+
+    def init_land_nodes(self):
+        state = self.state
+        self.x_home = (self.lon + 180) / 360.0 * state["width"]
+        self.y_home = (90 - self.lat) / 180.0 * state["height"]
+
+        self.update_land_nodes()
+
+        self.x_home_even = even_density(self.x_home.copy(), self.mass, 0, state["width"], 4)
+        self.y_home_even = even_density(self.y_home.copy(), self.mass, 0, state["height"], 4)
+
+        self.x, self.y = self.node_home()
+
+    def update_land_nodes(self):
+        state = self.state
+        self.mass = self.land_mass()
+        mass_area_ratio = state["surface"] * state["density"] / self.mass.sum()
+        self.radius = np.sqrt(self.mass * mass_area_ratio / np.pi)
+
+    def init_land_links(self):
+        with np.errstate(divide="ignore"):
+            self.link_weight = np.maximum(
+                self.link_perimeter / self.perimeter[self.source],
+                self.link_perimeter / self.perimeter[self.target])
+        # Undirected adjacency keys, for the collision land link test.
+        n = max(len(self), 1)
+        self.link_keys = np.unique(np.concatenate([
+            self.source * n + self.target,
+            self.target * n + self.source,
+        ]))
+        # d3 splits each link's correction by node degree.
+        self.degree = (np.bincount(self.source, minlength=len(self)) +
+                       np.bincount(self.target, minlength=len(self)))
+
+    # Calculate
+
+    def node_home(self):
+        t = self.state["homeEvenDensity"]
+        return (lerp(self.x_home, self.x_home_even, t),
+                lerp(self.y_home, self.y_home_even, t))
+
+    def bounding_box(self):
+        return {
+            "xLo": (self.x - self.radius).min(),
+            "xHi": (self.x + self.radius).max(),
+            "yLo": (self.y - self.radius).min(),
+            "yHi": (self.y + self.radius).max(),
+        }
+
+    def is_linked(self, i, j):
+        keys = i * max(len(self), 1) + j
+        if not len(self.link_keys):
+            return np.zeros(len(keys), dtype=bool)
+        position = np.searchsorted(self.link_keys, keys)
+        position = np.minimum(position, len(self.link_keys) - 1)
+        return self.link_keys[position] == keys
+
+    # d3.layout.force
+
+    def update(self):
+        # Recompute link distances and strengths, as `force.update()` is
+        # called after every tick.
+        state = self.state
+        self.distances = self.radius[self.source] + self.radius[self.target]
+        self.strengths = self.link_weight * min(
+            state["linkGain"], ((state["ticks"] or 0) + self.warm_ticks) * 0.1)
+
+    def link_force(self, alpha):
+        s, t = self.source, self.target
+        dx = self.x[t] - self.x[s]
+        dy = self.y[t] - self.y[s]
+        l = np.sqrt(dx * dx + dy * dy)
+        moving = l > 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            k = np.where(moving, alpha * self.strengths * (l - self.distances) / l, 0)
+        dx *= k
+        dy *= k
+        ws, wt = self.degree[s], self.degree[t]
+        k = ws / (wt + ws).astype(np.float64)
+        n = len(self)
+        self.x -= np.bincount(t, dx * k, minlength=n)
+        self.y -= np.bincount(t, dy * k, minlength=n)
+        self.x += np.bincount(s, dx * (1 - k), minlength=n)
+        self.y += np.bincount(s, dy * (1 - k), minlength=n)
+
+    def charge_force(self, alpha):
+        charge = alpha * self.state["chargeGain"]
+        dx = self.x[None, :] - self.x[:, None]
+        dy = self.y[None, :] - self.y[:, None]
+        dn = dx * dx + dy * dy
+        np.fill_diagonal(dn, np.inf)
+        dn[dn == 0] = np.inf
+        self.px -= (dx * charge / dn).sum(axis=1)
+        self.py -= (dy * charge / dn).sum(axis=1)
+
+    def integrate(self):
+        x, y = self.x.copy(), self.y.copy()
+        self.x -= (self.px - x) * FRICTION
+        self.y -= (self.py - y) * FRICTION
+        self.px, self.py = x, y
+
+    # Node functions
+
+    def collide_pairs(self):
+        # Farthest apart any two nodes can be and still collide.
+        state = self.state
+        reach = (2 * self.radius.max() + state["seaDistance"] +
+                 max(state["groupDistance"], 0))
+        return broadphase.candidate_pairs(self.x, self.y, reach, self.method)
+
+    def node_collide(self):
+        state = self.state
+        i, j = self.collide_pairs()
+        if not len(i):
+            return
+        x = self.x[i] - self.x[j]
+        y = self.y[i] - self.y[j]
+        l = np.sqrt(x * x + y * y)
+        r = self.radius[i] + self.radius[j]
+        sea = ~self.is_linked(i, j)
+        r += sea * (state["seaDistance"] +
+                    (self.group[i] != self.group[j]) * state["groupDistance"])
+        hit = (l < r) & (l > 0)
+        i, j, x, y, l, r = i[hit], j[hit], x[hit], y[hit], l[hit], r[hit]
+        l = (l - r) / l * .5
+        x *= l
+        y *= l
+        n = len(self)
+        if self.fixed.any():
+            # A free node takes the whole correction from a fixed one.
+            fixed_i, fixed_j = self.fixed[i], self.fixed[j]
+            push_i = np.where(fixed_i, 0, np.where(fixed_j, 2, 1))
+            push_j = np.where(fixed_j, 0, np.where(fixed_i, 2, 1))
+            self.x += np.bincount(j, x * push_j, minlength=n) - np.bincount(i, x * push_i, minlength=n)
+            self.y += np.bincount(j, y * push_j, minlength=n) - np.bincount(i, y * push_i, minlength=n)
+            return
+        self.x += np.bincount(j, x, minlength=n) - np.bincount(i, x, minlength=n)
+        self.y += np.bincount(j, y, minlength=n) - np.bincount(i, y, minlength=n)
+
+    def node_home_tether(self, alpha):
+        x_home, y_home = self.node_home()
+        self.x += (x_home - self.x) * alpha * self.mass
+        self.y += (y_home - self.y) * alpha * self.mass
+
+    def node_frame(self, alpha):
+        state = self.state
+        bbox = self.bounding_box()
+        x_scale = (state["width"] - 2 * state["framePadding"]) / (bbox["xHi"] - bbox["xLo"])
+        y_scale = (state["height"] - 2 * state["framePadding"]) / (bbox["yHi"] - bbox["yLo"])
+        dx = (self.x - bbox["xLo"]) * x_scale + state["framePadding"] - self.x
+        dy = (self.y - bbox["yLo"]) * y_scale + state["framePadding"] - self.y
+        self.x += dx * alpha
+        self.y += dy * alpha
+
+    # Force
+
+    def force_tick(self):
+        state = self.state
+        state["ticks"] = (state["ticks"] or 0) + 1
+
+        if state["density"] > state["targetDensity"]:
+            state["density"] -= state["stepDensity"]
+            self.update_land_nodes()
+        if state["density"] < state["targetDensity"]:
+            state["density"] += state["stepDensity"]
+            self.update_land_nodes()
+
+        self.node_collide()
+
+        if state["homeGain"]:
+            self.node_home_tether(state["homeGain"] * self.alpha)
+
+        if state["frameGain"]:
+            self.node_frame(state["frameGain"] * self.alpha)
+
+    def tick(self):
+        self.alpha *= ALPHA_DECAY
+        if self.alpha < END_ALPHA:
+            self.alpha = 0
+            self.state["alpha"] = 0
+            return False
+
+        self.link_force(self.alpha)
+        if self.state["chargeGain"]:
+            self.charge_force(self.alpha)
+        self.integrate()
+
+        self.force_tick()
+        self.pin()
+        self.state["alpha"] = self.alpha
+        self.update()
+        return True
+
+    # Controls, as the buttons and sliders in generate.js
+
+    def reset(self):
+        self.reset_state()
+        self.update_land_nodes()
+        self.px = self.x.copy()
+        self.py = self.y.copy()
+        self.state["ticks"] = 0
+        self.warm_ticks = 0
+        self.alpha = START_ALPHA
+        self.update()
+
+    def restart(self, alpha=RESTART_ALPHA):
+        self.alpha = max(self.alpha, alpha)
+
+    def set_state(self, state):
+        # Ignore run-derived values, so a client can send back its whole
+        # state.
+        for key, value in state.items():
+            if key in self.state and key not in DERIVED_KEYS:
+                self.state[key] = value
+        self.update_land_nodes()
+        self.update()
+
+    def pin(self):
+        # Like d3's `fixed`, but held through the collision, tether and
+        # frame steps as well.
+        if not self.fixed.any():
+            return
+        self.x[self.fixed] = self.px[self.fixed] = self.x_fixed
+        self.y[self.fixed] = self.py[self.fixed] = self.y_fixed
+
+    # Warm start
+
+    def neighbourhood(self, mask, depth=1):
+        # Grow `mask` by nodes in reach of a collision or sharing a link.
+        state = self.state
+        reach = 2 * self.radius.max() + state["seaDistance"] + max(state["groupDistance"], 0)
+        i, j = broadphase.candidate_pairs(self.x, self.y, reach, self.method)
+        i = np.concatenate([i, self.source])
+        j = np.concatenate([j, self.target])
+        mask = mask.copy()
+        for level in range(depth):
+            grown = mask.copy()
+            grown[j[mask[i]]] = True
+            grown[i[mask[j]]] = True
+            mask = grown
+        return mask
+
+    def saved_radius_delta(self, old_radius, known, saved_state):
+        # Relative change of each known node's radius, on the saved
+        # layout's own scale: masses are normalised by the saved maximum
+        # population and area, and the radius scale is fitted to the
+        # saved radii, so a node whose own data is unchanged does not move
+        # when another node changes the totals.
+        mass = self.land_mass(saved_state.get("maxPopulation"),
+                              saved_state.get("maxArea"))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = old_radius[known] ** 2 / mass[known]
+            scale = np.median(ratio[np.isfinite(ratio)]) if known.any() else 0
+            return np.abs(np.sqrt(mass * scale) - old_radius) / old_radius
+
+    def warm_start(self, saved, alpha=WARM_ALPHA, tolerance=0.01, depth=1):
+        # Seed positions from a saved layout by code and leave only nodes
+        # near a changed population or area free to move. Unknown codes
+        # start at home.
+        nodes = dict((node["code"], node) for node in saved["nodes"])
+        known = np.array([code in nodes for code in self.codes], dtype=bool)
+        seeded = [nodes[code] for code in self.codes if code in nodes]
+
+        self.x[known] = [node["x"] for node in seeded]
+        self.y[known] = [node["y"] for node in seeded]
+
+        saved_state = saved["state"]
+        self.state["density"] = saved_state.get("density") or self.state["targetDensity"]
+        self.state["ticks"] = 0
+        self.warm_ticks = saved_state.get("ticks") or 0
+        self.update_land_nodes()
+
+        old_radius = np.zeros(len(self))
+        old_radius[known] = [node["radius"] for node in seeded]
+        delta = self.saved_radius_delta(old_radius, known, saved_state)
+        changed = ~known | ~(delta <= tolerance)
+        if not changed.any():
+            # Nothing to settle: the first tick ends the run.
+            active = changed
+            alpha = 0
+        else:
+            active = self.neighbourhood(changed, depth)
+
+        self.fixed = ~active
+        self.x_fixed = self.x[self.fixed]
+        self.y_fixed = self.y[self.fixed]
+        self.px = self.x.copy()
+        self.py = self.y.copy()
+        self.alpha = alpha
+        self.update()
+        return changed, active
+
+    def run(self, max_ticks=None):
+        ticks = 0
+        while self.tick():
+            ticks += 1
+            if max_ticks is not None and ticks >= max_ticks:
+                break
+        return ticks
+
+    def data(self):
+        state = dict((key, value.item() if hasattr(value, "item") else value)
+                     for key, value in self.state.items())
+        return {
+            "state": state,
+            "nodes": [
+                {
+                    "code": code,
+                    "name": name,
+                    "radius": radius,
+                    "x": x,
+                    "y": y,
+                }
+                for code, name, radius, x, y in zip(
+                    self.codes, self.names, self.radius.tolist(),
+                    self.x.tolist(), self.y.tolist())
+            ],
+        }
+
+
+
+def parse_option(text):
+    key, value = text.split("=", 1)
+    return key, json.loads(value)
+
+
+
+def layout(dots_path, state_path=None, options=None, max_ticks=None, method=None,
+           warm_path=None, binary_path=None):
+    log.info(dots_path)
+    graph = dotsbin.load_any(dots_path)
+
+    saved = None
+    if warm_path:
+        log.info(warm_path)
+        saved = dotsbin.load_any(warm_path)
+
+    state = {}
+    if state_path:
+        log.info(state_path)
+        state.update(read_state(state_path))
+    elif saved:
+        state.update(read_state(warm_path))
+    state.update(options or {})
+
+    simulation = Layout(graph, state, method)
+    if saved:
+        changed, active = simulation.warm_start(saved)
+        log.info("%d changed, %d of %d nodes free" % (
+            changed.sum(), active.sum(), len(simulation)))
+    ticks = simulation.run(max_ticks)
+    log.info("%d ticks" % ticks)
+
+    data = simulation.data()
+    json.dump(data, sys.stdout, indent=2)
+
+    if binary_path:
+        with open(binary_path, "wb") as binary_file:
+            dotsbin.dump_layout(binary_file, data)
+
+
+
+def main():
+    log.addHandler(logging.StreamHandler())
+
+    usage = """%prog DOTS
+
+DOTS    Graph JSON or binary from `compile_json.py`.
+
+Run the dot layout simulation to convergence and write the layout in the
+same format as the generate server's save button.
+"""
+
+    parser = OptionParser(usage=usage)
+    parser.add_option("-v", "--verbose", action="count", dest="verbose",
+                      help="Print verbose information for debugging.", default=0)
+    parser.add_option("-q", "--quiet", action="count", dest="quiet",
+                      help="Suppress warnings.", default=0)
+    parser.add_option("-s", "--state", action="store", dest="state",
+                      help="JSON state, or a saved layout to take the state from.", default=None)
+    parser.add_option("-o", "--option", action="append", dest="options",
+                      help="Override a state value, eg. 'homeGain=0.2'.", default=[])
+    parser.add_option("-m", "--method", action="store", dest="method",
+                      help="Collision broadphase: %s." % ", ".join(sorted(broadphase.METHODS)), default=None)
+    parser.add_option("-w", "--warm", action="store", dest="warm",
+                      help="Saved layout to start from, relaxing only around changed dots.", default=None)
+    parser.add_option("-b", "--binary", action="store", dest="binary",
+                      help="Also write the layout as columnar binary to this path.", default=None)
+    parser.add_option("-t", "--ticks", action="store", dest="ticks", type="int",
+                      help="Maximum number of ticks.", default=None)
+
+    (options, args) = parser.parse_args()
+    args = [arg.decode(sys.getfilesystemencoding()) for arg in args]
+
+    log_level = (logging.ERROR, logging.WARNING, logging.INFO, logging.DEBUG,)[
+        max(0, min(3, 1 + options.verbose - options.quiet))]
+
+    log.setLevel(log_level)
+
+    if not len(args) == 1:
+        parser.print_usage()
+        sys.exit(1)
+
+    (dots_path, ) = args
+
+    layout(dots_path, options.state,
+           dict(parse_option(text) for text in options.options),
+           options.ticks, options.method, options.warm, options.binary)
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Quality measures for a dot layout, either a running `layout.Layout` or
+# a layout saved by the generate server.
+
+import sys
+import json
+import logging
+from optparse import OptionParser
+
+import numpy as np
+
+import dotsbin
+import layout
+import broadphase
+
+
+
+log = logging.getLogger('metrics')
+
+
+
+def lens_area(r1, r2, d):
+    # Intersection area of circles with radii `r1`, `r2` and centers `d`
+    # apart, for overlapping pairs.
+    inside = d <= np.abs(r1 - r2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        a1 = np.arccos(np.clip((d * d + r1 * r1 - r2 * r2) / (2 * d * r1), -1, 1))
+        a2 = np.arccos(np.clip((d * d + r2 * r2 - r1 * r1) / (2 * d * r2), -1, 1))
+        kite = np.sqrt(np.maximum(
+            (-d + r1 + r2) * (d + r1 - r2) * (d - r1 + r2) * (d + r1 + r2), 0))
+        area = r1 * r1 * a1 + r2 * r2 * a2 - kite / 2
+    return np.where(inside, np.pi * np.minimum(r1, r2) ** 2, area)
+
+
+
+def nearest(i, j, distance, n):
+    # Nearest neighbour of each node among candidate pairs, or -1.
+    a = np.concatenate([i, j])
+    b = np.concatenate([j, i])
+    d = np.concatenate([distance, distance])
+    order = np.lexsort((d, a))
+    a, b = a[order], b[order]
+    first = np.ones(len(a), dtype=bool)
+    first[1:] = a[1:] != a[:-1]
+    result = np.empty(n, dtype=np.int64)
+    result.fill(-1)
+    result[a[first]] = b[first]
+    return result
+
+
+
+def measure(simulation, touch=0, tolerance=1.0):
+    state = simulation.state
+    x, y, radius = simulation.x, simulation.y, simulation.radius
+    n = len(simulation)
+    if not n:
+        return {}
+
+    # Overlaps
+
+    i, j = broadphase.candidate_pairs(x, y, 2 * radius.max(), simulation.method)
+    distance = np.hypot(x[i] - x[j], y[i] - y[j])
+    hit = distance < radius[i] + radius[j]
+    overlap_area = lens_area(radius[i][hit], radius[j][hit], distance[hit]).sum()
+    dot_area = (np.pi * radius * radius).sum()
+
+    # Land links: linked countries should still touch.
+
+    s, t = simulation.source, simulation.target
+    gap = np.hypot(x[s] - x[t], y[s] - y[t]) - radius[s] - radius[t]
+    touching = gap <= tolerance
+
+    # Displacement from home
+
+    x_home, y_home = simulation.node_home()
+    displacement = np.hypot(x - x_home, y - y_home)
+
+    # Group clustering: how often a node's nearest neighbour is in the
+    # same group, within the distance that could separate groups.
+
+    reach = 2 * radius.max() + state["seaDistance"] + max(state["groupDistance"], 0)
+    i, j = broadphase.candidate_pairs(x, y, reach, simulation.method)
+    gap = np.hypot(x[i] - x[j], y[i] - y[j]) - radius[i] - radius[j]
+    neighbour = nearest(i, j, gap, n)
+    has_neighbour = neighbour >= 0
+    same_group = (simulation.group[has_neighbour] ==
+                  simulation.group[neighbour[has_neighbour]])
+
+    bbox = simulation.bounding_box()
+
+    return {
+        "nodes": n,
+        "overlaps": int(hit.sum()),
+        "overlapArea": float(overlap_area),
+        "overlapRatio": float(overlap_area / dot_area),
+        "links": len(s),
+        "linksTouching": int(touching.sum()),
+        "linkPreservation": float(touching.mean()) if len(s) else 1.0,
+        "displacement": float(displacement.mean()),
+        "maxDisplacement": float(displacement.max()),
+        "minRadius": float(radius.min()),
+        "underTouch": int((radius < touch).sum()),
+        "groupClustering": float(same_group.mean()) if len(same_group) else 1.0,
+        "fill": float((bbox["xHi"] - bbox["xLo"]) * (bbox["yHi"] - bbox["yLo"]) /
+                      (state["width"] * state["height"])),
+    }
+
+
+
+def load_layout(graph, saved, method=None):
+    # Rebuild a simulation from `dots.json` and a saved layout, so homes
+    # are computed from the same state the layout was made with.
+    simulation = layout.Layout(graph, saved["state"], method)
+    nodes = dict((node["code"], node) for node in saved["nodes"])
+    missing = [code for code in simulation.codes if code not in nodes]
+    if missing:
+        raise ValueError("Saved layout has no position for %s." % ", ".join(missing))
+    for field, values in (("x", simulation.x), ("y", simulation.y), ("radius", simulation.radius)):
+        values[:] = [nodes[code][field] for code in simulation.codes]
+    return simulation
+
+
+
+def metrics(dots_path, layout_path, touch=0, tolerance=1.0, method=None):
+    log.info(dots_path)
+    graph = dotsbin.load_any(dots_path)
+    log.info(layout_path)
+    saved = dotsbin.load_any(layout_path)
+
+    simulation = load_layout(graph, saved, method)
+    json.dump(measure(simulation, touch, tolerance), sys.stdout, indent=2, sort_keys=True)
+
+
+
+def main():
+    log.addHandler(logging.StreamHandler())
+
+    usage = """%prog DOTS LAYOUT
+
+DOTS    Graph JSON or binary from `compile_json.py`.
+LAYOUT  Layout saved by the generate server or `layout.py`.
+
+Write quality measures for a layout as JSON.
+"""
+
+    parser = OptionParser(usage=usage)
+    parser.add_option("-v", "--verbose", action="count", dest="verbose",
+                      help="Print verbose information for debugging.", default=0)
+    parser.add_option("-q", "--quiet", action="count", dest="quiet",
+                      help="Suppress warnings.", default=0)
+    parser.add_option("-t", "--touch", action="store", dest="touch", type="float",
+                      help="Smallest acceptable dot radius.", default=0)
+    parser.add_option("-T", "--tolerance", action="store", dest="tolerance", type="float",
+                      help="Largest gap between linked dots that still counts as touching.", default=1.0)
+    parser.add_option("-m", "--method", action="store", dest="method",
+                      help="Collision broadphase: %s." % ", ".join(sorted(broadphase.METHODS)), default=None)
+
+    (options, args) = parser.parse_args()
+    args = [arg.decode(sys.getfilesystemencoding()) for arg in args]
+
+    log_level = (logging.ERROR, logging.WARNING, logging.INFO, logging.DEBUG,)[
+        max(0, min(3, 1 + options.verbose - options.quiet))]
+
+    log.setLevel(log_level)
+
+    if not len(args) == 2:
+        parser.print_usage()
+        sys.exit(1)
+
+    (dots_path, layout_path) = args
+
+    metrics(dots_path, layout_path, options.touch, options.tolerance, options.method)
+
+
+
+if __name__ == "__main__":
+    main()
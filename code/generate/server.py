@@ -5,21 +5,41 @@ import os
 import sys
 import time
 import json
+import gzip
 import errno
 import logging
 import datetime
+import tempfile
+import mimetypes
+import multiprocessing
 from hashlib import sha1
+from StringIO import StringIO
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
+
+import tornado.gen
 import tornado.httpserver
 import tornado.ioloop
 import tornado.options
 import tornado.web
+import tornado.websocket
 from tornado.options import define, options
 
+import layout
+import dotsbin
+
 
 
 define("port", default=8000, help="Run on the given port", type=int)
 define("data", default=None, help="Path to save data.", type=unicode)
+define("dots", default="dots.json", help="Graph JSON or binary to simulate.", type=unicode)
+define("fps", default=30, help="Simulation frames sent per second.", type=float)
+define("pretty", default=False, help="Indent saved JSON.", type=bool)
+define("compress", default=False, help="Gzip saved JSON.", type=bool)
+define("workers", default=4, help="Threads for writing saves.", type=int)
+define("immutable", default=["d3.patched.js"], multiple=True,
+       help="Static files that never change while the server runs.", type=unicode)
 
 
 
@@ -36,16 +56,25 @@ class Application(tornado.web.Application):
     title = u"Dotmap generate server"
 
     def __init__(self):
+        self.static_cache = StaticCache(".", options.immutable)
+
         handlers = [
             (r"/", RedirectHandler),
             (r"/save", SaveHandler),
-            (r'/(.*)', tornado.web.StaticFileHandler, {'path': "."}),
+            (r"/saves", SavesHandler),
+            (r"/simulate", SimulateHandler),
+            (r'/(.*)', StaticHandler, {'cache': self.static_cache}),
             ]
 
         self.data_path = options.data
+        self.dots_path = options.dots
+        self.graph = dotsbin.load_any(self.dots_path)
 
         assert os.path.isdir(self.data_path)
 
+        self.executor = ThreadPoolExecutor(options.workers)
+        self.saves = index_saves(self.data_path)
+
         settings = {
             }
 
@@ -61,6 +90,102 @@ class Application(tornado.web.Application):
 
 
 
+class StaticEntry(object):
+    # File contents held in memory, with a gzipped copy if it is smaller.
+    compress_types = ("text/", "application/javascript", "application/json",
+                      "application/x-javascript", "application/octet-stream",
+                      "image/svg+xml")
+
+    def __init__(self, path, mtime):
+        with open(path, "rb") as fp:
+            self.content = fp.read()
+        self.mtime = mtime
+        self.etag = '"%s"' % hash_hex(self.content)
+        self.content_type = (mimetypes.guess_type(path)[0] or
+                             "application/octet-stream")
+
+        self.gzip_content = None
+        if self.content_type.startswith(self.compress_types):
+            buf = StringIO()
+            with gzip.GzipFile(mode="wb", fileobj=buf, compresslevel=9, mtime=0) as fp:
+                fp.write(self.content)
+            if buf.tell() < len(self.content):
+                self.gzip_content = buf.getvalue()
+
+
+
+class StaticCache(object):
+    # Static files keyed by absolute path. Entries are built at startup
+    # and rebuilt when a file's mtime changes.
+    extensions = (".html", ".css", ".js", ".json", ".bin")
+
+    def __init__(self, root, immutable=()):
+        self.root = os.path.abspath(root)
+        self.immutable = set(immutable)
+        self.entries = {}
+        for name in os.listdir(self.root):
+            if name.endswith(self.extensions):
+                self.get(name)
+
+    def get(self, name):
+        path = os.path.abspath(os.path.join(self.root, name))
+        if not path.startswith(self.root + os.path.sep):
+            return None
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            self.entries.pop(path, None)
+            return None
+        if not os.path.isfile(path):
+            return None
+        entry = self.entries.get(path)
+        if entry is None or entry.mtime != mtime:
+            entry = self.entries[path] = StaticEntry(path, mtime)
+        return entry
+
+    def is_immutable(self, name):
+        return name in self.immutable
+
+
+
+class StaticHandler(tornado.web.RequestHandler):
+    def initialize(self, cache):
+        self.cache = cache
+
+    def head(self, name):
+        return self.get(name, include_body=False)
+
+    def get(self, name, include_body=True):
+        entry = self.cache.get(name)
+        if entry is None:
+            raise tornado.web.HTTPError(404)
+
+        accept = self.request.headers.get("Accept-Encoding", "")
+        use_gzip = entry.gzip_content is not None and "gzip" in accept
+
+        self.set_header("Content-Type", entry.content_type)
+        self.set_header("Vary", "Accept-Encoding")
+        self.set_header("Etag", entry.etag[:-1] + '-gz"' if use_gzip else entry.etag)
+        if self.cache.is_immutable(name):
+            self.set_header("Cache-Control", "public, max-age=31536000, immutable")
+        else:
+            self.set_header("Cache-Control", "no-cache")
+
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+
+        if use_gzip:
+            self.set_header("Content-Encoding", "gzip")
+            content = entry.gzip_content
+        else:
+            content = entry.content
+        self.set_header("Content-Length", len(content))
+        if include_body:
+            self.write(content)
+
+
+
 class RedirectHandler(tornado.web.RequestHandler): 
     def get(self):
         print "redirect"
@@ -68,23 +193,257 @@ class RedirectHandler(tornado.web.RequestHandler):
 
 
 
+def save_extension(compress):
+    return ".json.gz" if compress else ".json"
+
+
+
+def save_metadata(key, path, data, timestamp):
+    return {
+        "key": key,
+        "path": path,
+        "state": data.get("state"),
+        "nodes": len(data.get("nodes", [])),
+        "timestamp": timestamp,
+    }
+
+
+
+def read_save(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as fp:
+        return json.load(fp)
+
+
+
+def index_saves(data_path):
+    # Read existing saves once at startup. After that the index is kept up
+    # to date by `SaveHandler`.
+    saves = {}
+    for name in os.listdir(data_path):
+        for extension in (".json", ".json.gz"):
+            if not name.endswith(extension):
+                continue
+            key = name[:-len(extension)]
+            if len(key) != 40:
+                continue
+            path = os.path.join(data_path, name)
+            try:
+                data = read_save(path)
+            except (IOError, ValueError):
+                continue
+            if not isinstance(data, dict):
+                continue
+            saves[key] = save_metadata(key, path, data, os.path.getmtime(path))
+    return saves
+
+
+
+def write_save(data_path, body, pretty, compress):
+    # Runs on the executor. The key hashes a canonical compact form, so the
+    # same layout is only stored once however it was serialized.
+    data = json.loads(body)
+    if not isinstance(data, dict):
+        raise ValueError("Save is not a JSON object.")
+    compact = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    key = hash_hex(compact)
+
+    for extension in (save_extension(compress), save_extension(not compress)):
+        path = os.path.join(data_path, key + extension)
+        if os.path.exists(path):
+            return key, path, data, False
+
+    path = os.path.join(data_path, key + save_extension(compress))
+
+    text = json.dumps(data, sort_keys=True, indent=2) if pretty else compact
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", prefix=key, dir=data_path)
+    os.close(fd)
+    try:
+        os.chmod(tmp_path, 0644)
+        opener = gzip.open if compress else open
+        with opener(tmp_path, "wb") as fp:
+            fp.write(text)
+        # Linking fails if a concurrent post of the same layout got there
+        # first, where renaming would silently replace its file.
+        try:
+            os.link(tmp_path, path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            return key, path, data, False
+    finally:
+        os.remove(tmp_path)
+    return key, path, data, True
+
+
+
 class SaveHandler(tornado.web.RequestHandler):
+    @tornado.gen.coroutine
     def post(self):
-        
-        key = hash_hex(self.request.body)
-        data = json.loads(self.request.body)
-        path = os.path.join(self.application.data_path, key + ".json")
-        
-        with open(path, "w") as fp:
-            json.dump(data, fp, indent=2)
-        print "Saved: %s" % path
+        application = self.application
+
+        try:
+            key, path, data, written = yield tornado.ioloop.IOLoop.current().run_in_executor(
+                application.executor, write_save, application.data_path,
+                self.request.body, options.pretty, options.compress)
+        except ValueError:
+            raise tornado.web.HTTPError(400, "Invalid JSON.")
+
+        if key not in application.saves:
+            application.saves[key] = save_metadata(key, path, data, time.time())
+        print "%s: %s" % ("Saved" if written else "Exists", path)
 
         self.set_header("Content-Type", "application/json; charset=UTF-8")
-        self.write(json.dumps({"path": path}))
-        self.finish()
-        return
+        self.write(json.dumps({"key": key, "path": path, "written": written}))
+
 
 
+class SavesHandler(tornado.web.RequestHandler):
+    def get(self):
+        saves = sorted(self.application.saves.values(),
+                       key=lambda save: save["timestamp"], reverse=True)
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.write(json.dumps({"saves": saves}))
+
+
+
+def frame(simulation):
+    # Float32: ticks, alpha, density, then x, y, radius for each node in
+    # `dots.json` order.
+    header = [simulation.state["ticks"] or 0, simulation.alpha, simulation.state["density"]]
+    nodes = np.column_stack([simulation.x, simulation.y, simulation.radius])
+    return np.concatenate([header, nodes.ravel()]).astype("<f4").tostring()
+
+
+
+def simulate(conn, graph, fps):
+    # Worker process. Runs the layout while alpha lasts, sends frames no
+    # faster than `fps` and applies messages from the page between ticks.
+    simulation = layout.Layout(graph)
+    interval = 1.0 / fps
+    running = False
+    stop_alpha = None
+    sent = 0
+
+    conn.send_bytes(frame(simulation))
+    try:
+        while True:
+            # Block while idle rather than spinning.
+            timeout = 0 if running else None
+            while conn.poll(timeout):
+                timeout = 0
+                message = conn.recv()
+                if "state" in message:
+                    simulation.set_state(message["state"])
+                    simulation.restart()
+                    running = True
+                command = message.get("command")
+                if command == "close":
+                    return
+                elif command == "stop":
+                    stop_alpha = simulation.alpha
+                    running = False
+                elif command == "resume":
+                    simulation.restart(stop_alpha or layout.RESTART_ALPHA)
+                    stop_alpha = None
+                    running = True
+                elif command == "reset":
+                    simulation.reset()
+                    running = True
+
+            if running:
+                running = simulation.tick()
+
+            now = time.time()
+            if not running or now - sent >= interval:
+                conn.send_bytes(frame(simulation))
+                sent = now
+    except (EOFError, IOError):
+        pass
+
+
+
+def reap(io_loop, process, deadline):
+    # Wait for a worker to exit without blocking the IOLoop, terminating
+    # it once `deadline` has passed. `is_alive` reaps it when it is done.
+    if not process.is_alive():
+        print "Simulate end: %d" % process.pid
+        return
+    if time.time() >= deadline:
+        process.terminate()
+    io_loop.add_timeout(time.time() + 0.1, reap, io_loop, process, deadline)
+
+
+
+class SimulateHandler(tornado.websocket.WebSocketHandler):
+    process = None
+
+    def get(self, *args, **kwargs):
+        # Check arguments before the upgrade, so bad ones get a 400.
+        try:
+            self.fps = float(self.get_argument("fps", options.fps))
+        except ValueError:
+            self.fps = None
+        if not self.fps > 0:
+            raise tornado.web.HTTPError(400, "fps must be a positive number.")
+        return tornado.websocket.WebSocketHandler.get(self, *args, **kwargs)
+
+    def open(self):
+        graph = self.application.graph
+        fps = self.fps
+
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=simulate, args=(child_conn, graph, fps))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+
+        self.io_loop = tornado.ioloop.IOLoop.current()
+        self.io_loop.add_handler(
+            self.conn.fileno(), self.on_frame, tornado.ioloop.IOLoop.READ)
+        print "Simulate: %d" % self.process.pid
+
+    def on_frame(self, fd, events):
+        try:
+            data = self.conn.recv_bytes()
+        except (EOFError, IOError):
+            self.stop()
+            self.close()
+            return
+        try:
+            self.write_message(data, binary=True)
+        except tornado.websocket.WebSocketClosedError:
+            self.stop()
+
+    def on_message(self, message):
+        # The worker only takes objects, with `state` an object too.
+        try:
+            message = json.loads(message)
+        except ValueError:
+            return
+        if not isinstance(message, dict) or not isinstance(message.get("state", {}), dict):
+            return
+        try:
+            self.conn.send(message)
+        except IOError:
+            pass
+
+    def on_close(self):
+        self.stop()
+
+    def stop(self):
+        if not self.process:
+            return
+        self.io_loop.remove_handler(self.conn.fileno())
+        try:
+            self.conn.send({"command": "close"})
+        except IOError:
+            pass
+        self.conn.close()
+        reap(self.io_loop, self.process, time.time() + 1)
+        self.process = None
+
 
 
 def main():
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import csv
+import json
+import logging
+import itertools
+import multiprocessing
+from optparse import OptionParser
+
+import numpy as np
+
+import dotsbin
+import layout
+import metrics
+import broadphase
+
+
+
+log = logging.getLogger('sweep')
+
+
+
+SCORE_FIELDS = (
+    "overlaps",
+    "overlapArea",
+    "linkPreservation",
+    "displacement",
+    "minRadius",
+    "underTouch",
+    "groupClustering",
+    "fill",
+)
+
+# Set in each worker process by `init_worker`.
+worker_graph = None
+worker_state = None
+worker_method = None
+worker_touch = None
+
+
+
+def parse_grid(text):
+    key, values = text.split("=", 1)
+    return key, [json.loads(value) for value in values.split(",")]
+
+
+
+def parse_range(text):
+    key, values = text.split("=", 1)
+    lo, hi = values.split(":")
+    return key, (float(lo), float(hi))
+
+
+
+def configurations(grid, ranges, samples, seed):
+    keys = [key for key, values in grid]
+    grid_configs = [
+        dict(zip(keys, values))
+        for values in itertools.product(*[values for key, values in grid])
+    ]
+    if not ranges:
+        return grid_configs
+
+    random = np.random.RandomState(seed)
+    configs = []
+    for i in range(samples):
+        sample = dict((key, float(random.uniform(lo, hi))) for key, (lo, hi) in ranges)
+        for config in grid_configs:
+            config = dict(config)
+            config.update(sample)
+            configs.append(config)
+    return configs
+
+
+
+def rank_key(scores):
+    # Fewest overlaps, then dots big enough to touch, then closest to home.
+    return (scores["overlaps"], scores["underTouch"], scores["displacement"])
+
+
+
+def init_worker(graph, state, method, touch):
+    global worker_graph, worker_state, worker_method, worker_touch
+    worker_graph = graph
+    worker_state = state
+    worker_method = method
+    worker_touch = touch
+
+
+
+def run(config):
+    state = dict(worker_state)
+    state.update(config)
+    simulation = layout.Layout(worker_graph, state, worker_method)
+    simulation.run()
+    return config, metrics.measure(simulation, worker_touch), simulation.data()
+
+
+
+def write_table(out, keys, results):
+    writer = csv.writer(out)
+    writer.writerow(["rank"] + keys + list(SCORE_FIELDS))
+    for rank, (config, scores, data) in enumerate(results, 1):
+        writer.writerow(
+            [rank] +
+            [config.get(key) for key in keys] +
+            [scores[field] for field in SCORE_FIELDS]
+        )
+
+
+
+def write_layouts(path, results):
+    if not os.path.exists(path):
+        os.makedirs(path)
+    for rank, (config, scores, data) in enumerate(results, 1):
+        layout_path = os.path.join(path, "rank-%03d.json" % rank)
+        log.info(layout_path)
+        with open(layout_path, "w") as layout_file:
+            json.dump(data, layout_file, indent=2)
+
+
+
+def sweep(dots_path, grid, ranges, samples=10, seed=0,
+          state_path=None, method=None, jobs=None, touch=0,
+          best=0, layout_path=None):
+    log.info(dots_path)
+    graph = dotsbin.load_any(dots_path)
+
+    state = {}
+    if state_path:
+        state.update(layout.read_state(state_path))
+
+    configs = configurations(grid, ranges, samples, seed)
+    log.info("%d configurations" % len(configs))
+
+    pool = multiprocessing.Pool(jobs, init_worker, (graph, state, method, touch))
+    results = []
+    try:
+        for result in pool.imap_unordered(run, configs):
+            results.append(result)
+            log.debug("%d/%d %s" % (len(results), len(configs), json.dumps(result[0])))
+    finally:
+        pool.close()
+        pool.join()
+
+    results.sort(key=lambda result: rank_key(result[1]))
+
+    keys = [key for key, values in grid] + [key for key, values in ranges]
+    write_table(sys.stdout, keys, results)
+
+    if layout_path and best:
+        write_layouts(layout_path, results[:best])
+
+
+
+def main():
+    log.addHandler(logging.StreamHandler())
+
+    usage = """%prog DOTS
+
+DOTS    Graph JSON or binary from `compile_json.py`.
+
+Run the layout for a grid and/or random sample of state values across
+all cores, and write a CSV table ranked by score to stdout.
+
+  %prog dots.json -g linkGain=20,38 -r homeGain=0.1:1 -n 50 -k 5 -l best
+"""
+
+    parser = OptionParser(usage=usage)
+    parser.add_option("-v", "--verbose", action="count", dest="verbose",
+                      help="Print verbose information for debugging.", default=0)
+    parser.add_option("-q", "--quiet", action="count", dest="quiet",
+                      help="Suppress warnings.", default=0)
+    parser.add_option("-s", "--state", action="store", dest="state",
+                      help="JSON state, or a saved layout to take the state from.", default=None)
+    parser.add_option("-g", "--grid", action="append", dest="grid",
+                      help="Values to try, eg. 'linkGain=20,38'.", default=[])
+    parser.add_option("-r", "--range", action="append", dest="ranges",
+                      help="Range to sample uniformly, eg. 'homeGain=0.1:1'.", default=[])
+    parser.add_option("-n", "--samples", action="store", dest="samples", type="int",
+                      help="Number of random samples.", default=10)
+    parser.add_option("-S", "--seed", action="store", dest="seed", type="int",
+                      help="Random seed.", default=0)
+    parser.add_option("-j", "--jobs", action="store", dest="jobs", type="int",
+                      help="Worker processes. Default is one per core.", default=None)
+    parser.add_option("-m", "--method", action="store", dest="method",
+                      help="Collision broadphase: %s." % ", ".join(sorted(broadphase.METHODS)), default=None)
+    parser.add_option("-t", "--touch", action="store", dest="touch", type="float",
+                      help="Smallest acceptable dot radius.", default=0)
+    parser.add_option("-k", "--best", action="store", dest="best", type="int",
+                      help="Number of best layouts to write.", default=0)
+    parser.add_option("-l", "--layouts", action="store", dest="layouts",
+                      help="Directory to write the best layouts to.", default=None)
+
+    (options, args) = parser.parse_args()
+    args = [arg.decode(sys.getfilesystemencoding()) for arg in args]
+
+    log_level = (logging.ERROR, logging.WARNING, logging.INFO, logging.DEBUG,)[
+        max(0, min(3, 1 + options.verbose - options.quiet))]
+
+    log.setLevel(log_level)
+
+    if not len(args) == 1:
+        parser.print_usage()
+        sys.exit(1)
+
+    (dots_path, ) = args
+
+    sweep(
+        dots_path,
+        [parse_grid(text) for text in options.grid],
+        [parse_range(text) for text in options.ranges],
+        samples=options.samples,
+        seed=options.seed,
+        state_path=options.state,
+        method=options.method,
+        jobs=options.jobs,
+        touch=options.touch,
+        best=options.best,
+        layout_path=options.layouts,
+    )
+
+
+
+if __name__ == "__main__":
+    main()
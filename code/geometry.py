@@ -3,84 +3,19 @@
 
 import re
 import sys
+import json
 import shlex
+import struct
 
-from mako.template import Template
-from mako import exceptions
+from StringIO import StringIO
 
+import numpy as np
 
 
-class Geometry(object):
-
-    geo_template = """PGEOMETRY V5
-NPoints ${len(geometry.points)} NPrims ${len(geometry.prims)}
-NPointGroups 0 NPrimGroups 0
-NPointAttrib ${len(geometry.point_attrs)} NVertexAttrib 0 NPrimAttrib ${len(geometry.prim_attrs)} NAttrib ${int(bool(geometry.attr_names))}
-
-%if len(geometry.point_attrs):
-PointAttrib
-
-%for p, (name, point_attr) in enumerate(geometry.point_attrs.items()):
-%if name in geometry.point_attr_string_dict.keys():
-<% index = geometry.point_attr_string_dict[name] %>\
-${name} 1 index ${len(index)} \\
-%for text in index:
-"${text.replace('\\\\', '\\\\\\\\').replace('"', '\\\\"')}" \\
-%endfor
-
-%else:
-${name} ${point_attr["length"]} ${point_attr["type"] == int and "int" or "float"} ${" ".join([str(v) for v in point_attr["default"]])}
-%endif
-%endfor
-%endif
-
-%for p, point in enumerate(geometry.points):
-${"%f %f %f %f" % (point[0], point[1], point[2], 1.0)} \\
-%if geometry.point_attrs:
-(${"\t".join([" ".join([str(v) for v in geometry.point_attrs[key]["values"][p]]) for key in geometry.point_attrs])}) \\
-%endif
-
-%endfor
-
-
-%if len(geometry.prims):
-
-%if len(geometry.prim_attrs):
-PrimitiveAttrib
-
-%for p, (name, prim_attr) in enumerate(geometry.prim_attrs.items()):
-%if name in geometry.prim_attr_string_dict.keys():
-<% index = geometry.prim_attr_string_dict[name] %>\
-${name} 1 index ${len(index)} \\
-%for text in index:
-"${text.replace('\\\\', '\\\\\\\\').replace('"', '\\\\"')}" \\
-%endfor
-
-%else:
-${name} ${prim_attr["length"]} ${prim_attr["type"] == int and "int" or "float"} ${" ".join([str(v) for v in prim_attr["default"]])}
-%endif
-%endfor
-%endif
-
-%for p, prim in enumerate(geometry.prims):
-Poly ${len(prim["points"])} ${"<" if prim["closed"] else ":"} ${" ".join([str(v) for v in prim["points"]])} \\
-%if geometry.prim_attrs:
-(${"\t".join([" ".join([str(v) for v in geometry.prim_attrs[key]["values"][p]]) for key in geometry.prim_attrs])}) \\
-%endif
-
-%endfor
 
-%endif
-
-%if geometry.attr_names:
-DetailAttrib
-varmap 1 index ${len(geometry.attr_names)} ${" ".join(['"%s -> %s"' % (name, name) for name in geometry.attr_names])}
- (0)
-%endif
+class Geometry(object):
 
-beginExtra
-endExtra
-"""
+    chunk_size = 4096
 
     def __init__(self):
         self.points = []
@@ -89,6 +24,8 @@ endExtra
         self.prim_attrs = {}
         self.point_attr_string_dict = {}
         self.prim_attr_string_dict = {}
+        self.point_attr_string_index = {}
+        self.prim_attr_string_index = {}
 
 
     def add_point(self, x, y, z):
@@ -99,15 +36,32 @@ endExtra
         self.prims.append({"closed": closed, "points": point_numbers})
         return len(self.prims) - 1
 
-    def set_scalar_attr(self, attributes, obj, type_, name, index, values):
-        if not hasattr(values, "__len__"):
-            values = [values]
-        length = len(values)
+    def add_points(self, points):
+        if hasattr(points, "tolist"):
+            points = points.tolist()
+        return [self.add_point(*(tuple(point) + (0.0, ))[:3])
+                for point in points]
+
+    def add_prim_batch(self, point_numbers, counts, closed=True):
+        if hasattr(point_numbers, "tolist"):
+            point_numbers = point_numbers.tolist()
+        prim_numbers = []
+        start = 0
+        for count in counts:
+            prim_numbers.append(self.add_prim(
+                list(point_numbers[start:start + count]), closed))
+            start += count
+        return prim_numbers
+
+    def new_attr_values(self, type_, length):
+        return {}
+
+    def get_scalar_attr(self, attributes, obj, type_, name, length):
         if not name in attributes:
             attributes[name] = {
                 "type": type_,
                 "length": length,
-                "values": {},
+                "values": self.new_attr_values(type_, length),
                 "default": [type_() for i in range(length)],
             }
         else:
@@ -115,7 +69,19 @@ endExtra
                 raise TypeError("%s attribute '%s' already has type '%s'." % (obj, name, attributes[name]["type"]))
             if attributes[name]["length"] != length:
                 raise TypeError("%s attribute '%s' already has length '%s'." % (obj, name, attributes[name]["length"]))                
-        attributes[name]["values"][index] = values
+        return attributes[name]
+
+    def set_scalar_attr(self, attributes, obj, type_, name, index, values):
+        if not hasattr(values, "__len__"):
+            values = [values]
+        attr = self.get_scalar_attr(attributes, obj, type_, name, len(values))
+        attr["values"][index] = values
+
+    def set_scalar_attr_column(self, attributes, obj, type_, name, start, values):
+        if hasattr(values, "tolist"):
+            values = values.tolist()
+        for i, value in enumerate(values):
+            self.set_scalar_attr(attributes, obj, type_, name, start + i, value)
         
     def set_point_attr_int(self, name, index, values):
         self.set_scalar_attr(self.point_attrs, "Point", int, name, index, values)
@@ -123,16 +89,41 @@ endExtra
     def set_point_attr_float(self, name, index, values):
         self.set_scalar_attr(self.point_attrs, "Point", float, name, index, values)
 
-    def set_point_attr_string(self, name, index, value):
+    def set_point_attr_int_column(self, name, values, start=0):
+        self.set_scalar_attr_column(self.point_attrs, "Point", int, name, start, values)
+
+    def set_point_attr_float_column(self, name, values, start=0):
+        self.set_scalar_attr_column(self.point_attrs, "Point", float, name, start, values)
+
+    def intern_strings(self, string_dict, string_index, name, values):
         assert hasattr(name, "strip")
+        if not name in string_dict:
+            string_dict[name] = []
+            string_index[name] = {}
+        strings = string_dict[name]
+        index = string_index[name]
+        numbers = []
+        for value in values:
+            number = index.get(value)
+            if number is None:
+                number = index[value] = len(strings)
+                strings.append(value)
+            numbers.append(number)
+        return numbers
+
+    def set_point_attr_string(self, name, index, value):
         assert index == int(index)
-        if not name in self.point_attr_string_dict:
-            self.point_attr_string_dict[name] = []
-        if not value in self.point_attr_string_dict[name]:
-            self.point_attr_string_dict[name].append(value)
-        value = self.point_attr_string_dict[name].index(value)
+        (value, ) = self.intern_strings(
+            self.point_attr_string_dict, self.point_attr_string_index,
+            name, [value])
         self.set_scalar_attr(self.point_attrs, "Point", str, name, index, value)
 
+    def set_point_attr_string_column(self, name, values, start=0):
+        values = self.intern_strings(
+            self.point_attr_string_dict, self.point_attr_string_index,
+            name, values)
+        self.set_scalar_attr_column(self.point_attrs, "Point", str, name, start, values)
+
 
     def set_prim_attr_int(self, name, index, values):
         self.set_scalar_attr(self.prim_attrs, "Prim", int, name, index, values)
@@ -140,16 +131,25 @@ endExtra
     def set_prim_attr_float(self, name, index, values):
         self.set_scalar_attr(self.prim_attrs, "Prim", float, name, index, values)
 
+    def set_prim_attr_int_column(self, name, values, start=0):
+        self.set_scalar_attr_column(self.prim_attrs, "Prim", int, name, start, values)
+
+    def set_prim_attr_float_column(self, name, values, start=0):
+        self.set_scalar_attr_column(self.prim_attrs, "Prim", float, name, start, values)
+
     def set_prim_attr_string(self, name, index, value):
-        assert hasattr(name, "strip")
         assert index == int(index)
-        if not name in self.prim_attr_string_dict:
-            self.prim_attr_string_dict[name] = []
-        if not value in self.prim_attr_string_dict[name]:
-            self.prim_attr_string_dict[name].append(value)
-        value = self.prim_attr_string_dict[name].index(value)
+        (value, ) = self.intern_strings(
+            self.prim_attr_string_dict, self.prim_attr_string_index,
+            name, [value])
         self.set_scalar_attr(self.prim_attrs, "Prim", str, name, index, value)
 
+    def set_prim_attr_string_column(self, name, values, start=0):
+        values = self.intern_strings(
+            self.prim_attr_string_dict, self.prim_attr_string_index,
+            name, values)
+        self.set_scalar_attr_column(self.prim_attrs, "Prim", str, name, start, values)
+
 
     def get_point_attr(self, name, index):
         assert name in self.point_attrs, "No such point attribute '%s'." % name
@@ -173,11 +173,405 @@ endExtra
     def attr_names(self):
         return self.point_attrs.keys() + self.prim_attrs.keys()
 
+    def write_attr_definitions(self, attributes, string_dict):
+        for name, attr in attributes.items():
+            if name in string_dict:
+                index = string_dict[name]
+                yield "%s 1 index %d %s\n" % (name, len(index), "".join([
+                    '"%s" ' % text.replace('\\', '\\\\').replace('"', '\\"')
+                    for text in index]))
+            else:
+                yield "%s %d %s %s\n" % (
+                    name, attr["length"],
+                    attr["type"] == int and "int" or "float",
+                    " ".join([str(v) for v in attr["default"]]))
+
+    def write_attr_values(self, attributes, index):
+        return "(%s) " % "\t".join([
+            " ".join([str(v) for v in attr["values"][index]])
+            for attr in attributes.values()])
+
+    def write_point_lines(self):
+        for p, point in enumerate(self.points):
+            line = "%f %f %f %f " % (point[0], point[1], point[2], 1.0)
+            if self.point_attrs:
+                line += self.write_attr_values(self.point_attrs, p)
+            yield line + "\n"
+
+    def write_prim_lines(self):
+        for p, prim in enumerate(self.prims):
+            line = "Poly %d %s %s " % (
+                len(prim["points"]), "<" if prim["closed"] else ":",
+                " ".join([str(v) for v in prim["points"]]))
+            if self.prim_attrs:
+                line += self.write_attr_values(self.prim_attrs, p)
+            yield line + "\n"
+
+    def write_lines(self):
+        yield "PGEOMETRY V5\n"
+        yield "NPoints %d NPrims %d\n" % (len(self.points), len(self.prims))
+        yield "NPointGroups 0 NPrimGroups 0\n"
+        yield "NPointAttrib %d NVertexAttrib 0 NPrimAttrib %d NAttrib %d\n" % (
+            len(self.point_attrs), len(self.prim_attrs),
+            int(bool(self.attr_names)))
+        yield "\n"
+
+        if self.point_attrs:
+            yield "PointAttrib\n"
+            yield "\n"
+            for line in self.write_attr_definitions(
+                    self.point_attrs, self.point_attr_string_dict):
+                yield line
+        yield "\n"
+
+        for line in self.write_point_lines():
+            yield line
+        yield "\n"
+        yield "\n"
+
+        if self.prims:
+            yield "\n"
+            if self.prim_attrs:
+                yield "PrimitiveAttrib\n"
+                yield "\n"
+                for line in self.write_attr_definitions(
+                        self.prim_attrs, self.prim_attr_string_dict):
+                    yield line
+            yield "\n"
+
+            for line in self.write_prim_lines():
+                yield line
+            yield "\n"
+        yield "\n"
+
+        if self.attr_names:
+            yield "DetailAttrib\n"
+            yield "varmap 1 index %d %s\n" % (
+                len(self.attr_names),
+                " ".join(['"%s -> %s"' % (name, name)
+                          for name in self.attr_names]))
+            yield " (0)\n"
+        yield "\n"
+
+        yield "beginExtra\n"
+        yield "endExtra\n"
+
+    def write(self, fp):
+        # Stream in chunks of lines rather than building the whole file.
+        chunk = []
+        for line in self.write_lines():
+            chunk.append(line)
+            if len(chunk) >= self.chunk_size:
+                fp.write("".join(chunk))
+                chunk = []
+        if chunk:
+            fp.write("".join(chunk))
+
     def render(self):
-        try:
-            return Template(self.geo_template).render(geometry=self)
-        except:
-            print exceptions.text_error_template().render()
+        fp = StringIO()
+        self.write(fp)
+        return fp.getvalue()
+
+
+BINARY_MAGIC = "NPGEO001"
+BINARY_ALIGN = 16
+BINARY_TYPES = {
+    int: "int",
+    float: "float",
+    str: "index",
+}
+
+
+
+class Column(object):
+    # Growable NumPy array, doubling its capacity as rows are added.
+
+    def __init__(self, dtype, width=None, capacity=1024):
+        self.width = width
+        self.data = np.zeros(self.shape(capacity), dtype=dtype)
+        self.size = 0
+
+    def shape(self, rows):
+        if self.width is None:
+            return (rows, )
+        return (rows, self.width)
+
+    def reserve(self, size):
+        if size > len(self.data):
+            data = np.zeros(self.shape(max(size, 2 * len(self.data))),
+                            dtype=self.data.dtype)
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+
+    def resize(self, size):
+        self.reserve(size)
+        if size > self.size:
+            self.data[self.size:size] = 0
+        self.size = size
+
+    def append(self, value):
+        self.reserve(self.size + 1)
+        self.data[self.size] = value
+        self.size += 1
+        return self.size - 1
+
+    def extend(self, values, start=None):
+        if start is None:
+            start = self.size
+        stop = start + len(values)
+        if stop > self.size:
+            self.resize(stop)
+        self.data[start:stop] = values
+        return start
+
+    def __len__(self):
+        return self.size
+
+    def __setitem__(self, index, value):
+        if index >= self.size:
+            self.resize(index + 1)
+        self.data[index] = value
+
+    def get(self, index, default=None):
+        if index >= self.size:
+            return default
+        return self.data[index].tolist()
+
+    @property
+    def array(self):
+        return self.data[:self.size]
+
+
+
+def wrap_column(array):
+    column = Column(array.dtype, None if array.ndim == 1 else array.shape[1], 0)
+    column.data = array
+    column.size = len(array)
+    return column
+
+
+
+class PrimList(object):
+    # Read-only list-of-dicts view onto the CSR prim arrays of an
+    # `ArrayGeometry`.
+
+    def __init__(self, geometry):
+        self.geometry = geometry
+
+    def __len__(self):
+        return len(self.geometry.prim_closed)
+
+    def __getitem__(self, index):
+        offsets = self.geometry.prim_offsets.data
+        return {
+            "closed": bool(self.geometry.prim_closed.data[index]),
+            "points": self.geometry.prim_vertices.data[
+                offsets[index]:offsets[index + 1]].tolist(),
+        }
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+
+class ArrayGeometry(Geometry):
+    # Columnar backend: points are a float64 (N, 3) array, prims are CSR
+    # offsets into a vertex index array, and attributes are typed columns.
+
+    dtypes = {
+        int: np.int64,
+        float: np.float64,
+        str: np.int64,
+    }
+
+    def __init__(self):
+        self.point_column = Column(np.float64, 3)
+        self.prim_vertices = Column(np.int64)
+        self.prim_offsets = Column(np.int64)
+        self.prim_offsets.append(0)
+        self.prim_closed = Column(np.bool_)
+        self.point_attrs = {}
+        self.prim_attrs = {}
+        self.point_attr_string_dict = {}
+        self.prim_attr_string_dict = {}
+        self.point_attr_string_index = {}
+        self.prim_attr_string_index = {}
+
+    @property
+    def points(self):
+        return self.point_column.array
+
+    @property
+    def prims(self):
+        return PrimList(self)
+
+    def add_point(self, x, y, z):
+        return self.point_column.append((x, y, z))
+
+    def add_points(self, points):
+        points = np.asarray(points, dtype=np.float64)
+        start = len(self.point_column)
+        if not len(points):
+            return np.arange(start, start)
+        self.point_column.resize(start + len(points))
+        self.point_column.data[start:start + len(points), :points.shape[1]] = points
+        return np.arange(start, start + len(points))
+
+    def add_prim(self, point_numbers, closed=True):
+        self.prim_vertices.extend(point_numbers)
+        self.prim_offsets.append(len(self.prim_vertices))
+        return self.prim_closed.append(closed)
+
+    def add_prim_batch(self, point_numbers, counts, closed=True):
+        counts = np.asarray(counts, dtype=np.int64)
+        end = len(self.prim_vertices)
+        self.prim_vertices.extend(point_numbers)
+        self.prim_offsets.extend(end + np.cumsum(counts))
+        start = len(self.prim_closed)
+        self.prim_closed.resize(start + len(counts))
+        self.prim_closed.data[start:start + len(counts)] = closed
+        return np.arange(start, start + len(counts))
+
+    def new_attr_values(self, type_, length):
+        return Column(self.dtypes[type_], length)
+
+    def attr_array(self, attributes, name, size):
+        attr = attributes[name]
+        values = attr["values"]
+        values.resize(max(size, len(values)))
+        array = values.array[:size]
+        if attr["length"] == 1:
+            array = array[:, 0]
+        return array
+
+    def point_attr_array(self, name):
+        assert name in self.point_attrs, "No such point attribute '%s'." % name
+        return self.attr_array(self.point_attrs, name, len(self.point_column))
+
+    def prim_attr_array(self, name):
+        assert name in self.prim_attrs, "No such primitive attribute '%s'." % name
+        return self.attr_array(self.prim_attrs, name, len(self.prim_closed))
+
+    def set_scalar_attr_column(self, attributes, obj, type_, name, start, values):
+        values = np.asarray(values)
+        length = 1 if values.ndim == 1 else values.shape[1]
+        attr = self.get_scalar_attr(attributes, obj, type_, name, length)
+        attr["values"].extend(values.reshape((len(values), length)), start)
+
+    def attr_value_columns(self, attributes, size):
+        columns = []
+        for attr in attributes.values():
+            values = attr["values"]
+            values.resize(max(size, len(values)))
+            array = values.array[:size]
+            for k in range(attr["length"]):
+                columns.append(array[:, k])
+        return columns
+
+    def attr_value_format(self, attributes):
+        if not attributes:
+            return ""
+        return "(%s) " % "\t".join([
+            " ".join(["%s"] * attr["length"]) for attr in attributes.values()])
+
+    def write_point_lines(self):
+        template = "%f %f %f 1.000000 " + self.attr_value_format(self.point_attrs) + "\n"
+        count = len(self.point_column)
+        attr_columns = self.attr_value_columns(self.point_attrs, count)
+        for start in range(0, count, self.chunk_size):
+            stop = min(count, start + self.chunk_size)
+            points = self.points[start:stop]
+            columns = [points[:, k].tolist() for k in range(3)]
+            columns += [column[start:stop].tolist() for column in attr_columns]
+            values = tuple([v for row in zip(*columns) for v in row])
+            yield (template * (stop - start)) % values
+
+    def write_prim_lines(self):
+        count = len(self.prim_closed)
+        if self.prim_attrs:
+            columns = [column.tolist() for column in
+                       self.attr_value_columns(self.prim_attrs, count)]
+            attr_format = self.attr_value_format(self.prim_attrs)
+        offsets = self.prim_offsets.array.tolist()
+        for start in range(0, count, self.chunk_size):
+            stop = min(count, start + self.chunk_size)
+            vertices = self.prim_vertices.data[
+                offsets[start]:offsets[stop]].tolist()
+            base = offsets[start]
+            closed = self.prim_closed.data[start:stop].tolist()
+            lines = []
+            for p in range(start, stop):
+                line = "Poly %d %s %s " % (
+                    offsets[p + 1] - offsets[p], "<" if closed[p - start] else ":",
+                    " ".join([str(v) for v in vertices[
+                        offsets[p] - base:offsets[p + 1] - base]]))
+                if self.prim_attrs:
+                    line += attr_format % tuple([column[p] for column in columns])
+                lines.append(line + "\n")
+            yield "".join(lines)
+
+    def binary_attrs(self, prefix, attributes, string_dict, size):
+        arrays = []
+        specs = []
+        for name, attr in attributes.items():
+            values = attr["values"]
+            values.resize(max(size, len(values)))
+            arrays.append(("%s/%s" % (prefix, name), values.array[:size]))
+            spec = {
+                "name": name,
+                "type": BINARY_TYPES[attr["type"]],
+                "length": attr["length"],
+                "default": attr["default"],
+            }
+            if name in string_dict:
+                spec["strings"] = string_dict[name]
+            specs.append(spec)
+        return arrays, specs
+
+    def save(self, path):
+        # Binary sidecar: a JSON header followed by aligned raw arrays that
+        # `load` can memory-map without parsing.
+        arrays = [
+            ("points", self.points),
+            ("prim_vertices", self.prim_vertices.array),
+            ("prim_offsets", self.prim_offsets.array),
+            ("prim_closed", self.prim_closed.array),
+        ]
+        point_arrays, point_specs = self.binary_attrs(
+            "point_attrs", self.point_attrs, self.point_attr_string_dict,
+            len(self.point_column))
+        prim_arrays, prim_specs = self.binary_attrs(
+            "prim_attrs", self.prim_attrs, self.prim_attr_string_dict,
+            len(self.prim_closed))
+        arrays += point_arrays + prim_arrays
+
+        header = {
+            "arrays": [],
+            "point_attrs": point_specs,
+            "prim_attrs": prim_specs,
+        }
+        offset = 0
+        for name, array in arrays:
+            header["arrays"].append({
+                "name": name,
+                "dtype": array.dtype.str,
+                "shape": array.shape,
+                "offset": offset,
+            })
+            offset += -(-array.nbytes // BINARY_ALIGN) * BINARY_ALIGN
+        header = json.dumps(header)
+        start = len(BINARY_MAGIC) + 4 + len(header)
+        padding = -start % BINARY_ALIGN
+
+        with open(path, "wb") as binary_file:
+            binary_file.write(BINARY_MAGIC)
+            binary_file.write(struct.pack("<I", len(header) + padding))
+            binary_file.write(header + " " * padding)
+            for name, array in arrays:
+                data = np.ascontiguousarray(array).tostring()
+                binary_file.write(data)
+                binary_file.write("\0" * (-len(data) % BINARY_ALIGN))
 
 
 
@@ -338,3 +732,182 @@ def read(path):
             prims += 1
 
     return geo
+
+
+
+re_headlines = [
+    (re.compile("PGEOMETRY V5$"), ()),
+    (re.compile("NPoints (\d+) NPrims (\d+)$"), ("npoints", "nprims")),
+    (re.compile("NPointGroups (\d+) NPrimGroups (\d+)$"), ("npointgroups", "nprimgroups")),
+    (re.compile("NPointAttrib (\d+) NVertexAttrib (\d+) NPrimAttrib (\d+) NAttrib (\d+)$"), ("npointattrib", "nvertexattrib", "nprimattrib", "nattrib")),
+    ]
+re_run = re.compile("Run \d+ Poly$")
+
+
+
+def set_attr_columns(geo, attributes, values, attrs, string_dict, string_index, obj):
+    column = 0
+    for attr in attributes:
+        if attr["type"] == "index":
+            string_dict[attr["name"]] = list(attr["values"])
+            string_index[attr["name"]] = dict(
+                (value, i) for i, value in enumerate(attr["values"]))
+            geo.set_scalar_attr_column(attrs, obj, str, attr["name"], 0,
+                                       values[:, column].astype(np.int64))
+            column += 1
+            continue
+        length = len(attr["values"])
+        if attr["type"] == "int":
+            type_, dtype = int, np.int64
+        elif attr["type"] == "float":
+            type_, dtype = float, np.float64
+        else:
+            raise TypeError, "Type '%s' not recognised." % attr["type"]
+        geo.set_scalar_attr_column(attrs, obj, type_, attr["name"], 0,
+                                   values[:, column:column + length].astype(dtype))
+        column += length
+
+
+
+def parse_point_block(lines, npoints, point_attributes):
+    width = 4 + attributes_length(point_attributes)
+    if not npoints:
+        return np.zeros((0, width))
+    block = " ".join(lines).replace("(", " ").replace(")", " ")
+    values = np.fromstring(block, dtype=np.float64, sep=" ")
+    assert len(values) == npoints * width, (len(values), npoints, width)
+    return values.reshape((npoints, width))
+
+
+
+def parse_prim_block(lines, prim_attributes):
+    width = attributes_length(prim_attributes)
+    block = " ".join([
+        line if line.startswith("Poly") else "Poly " + line
+        for line in lines])
+    for char in "[]()":
+        block = block.replace(char, " ")
+    tokens = np.array(block.split())
+    starts = np.flatnonzero(tokens == "Poly")
+    counts = tokens[starts + 1].astype(np.int64)
+    closed = tokens[starts + 2] == "<"
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    vertex_index = (np.repeat(starts + 3 - offsets[:-1], counts) +
+                    np.arange(offsets[-1]))
+    vertices = tokens[vertex_index].astype(np.int64)
+    attr_index = (starts + 3 + counts)[:, None] + np.arange(width)[None, :]
+    values = tokens[attr_index].astype(np.float64)
+    return vertices, counts, closed, values
+
+
+
+def read_array(path):
+    # Columnar reader: the header and attribute definitions are parsed line
+    # by line, the point and prim blocks in a single pass each.
+    with open(path) as geo_file:
+        lines = [line.strip() for line in geo_file.read().splitlines()]
+    lines = [line for line in lines if line]
+
+    attr = {}
+    for (regex, keys), line in zip(re_headlines, lines):
+        match = regex.match(line)
+        if not match:
+            print "Failed to match '%s' with line '%s'." % (regex.pattern, line)
+            sys.exit(1)
+        attr.update(dict(zip(keys, [int(x) for x in match.groups()])))
+    i = len(re_headlines)
+
+    point_attributes = []
+    if i < len(lines) and lines[i] == "PointAttrib":
+        i += 1
+        while parse_attribute_definition(lines[i], point_attributes):
+            i += 1
+    point_lines = lines[i:i + attr["npoints"]]
+    i += attr["npoints"]
+
+    prim_attributes = []
+    if i < len(lines) and lines[i] == "PrimitiveAttrib":
+        i += 1
+        while parse_attribute_definition(lines[i], prim_attributes):
+            i += 1
+    prim_lines = []
+    while len(prim_lines) < attr["nprims"]:
+        if not re_run.match(lines[i]):
+            prim_lines.append(lines[i])
+        i += 1
+
+    geo = ArrayGeometry()
+
+    values = parse_point_block(point_lines, attr["npoints"], point_attributes)
+    geo.add_points(values[:, :3])
+    set_attr_columns(geo, point_attributes, values[:, 4:], geo.point_attrs,
+                     geo.point_attr_string_dict, geo.point_attr_string_index,
+                     "Point")
+
+    if prim_lines:
+        vertices, counts, closed, values = parse_prim_block(
+            prim_lines, prim_attributes)
+        prims = geo.add_prim_batch(vertices, counts)
+        geo.prim_closed.data[prims] = closed
+        set_attr_columns(geo, prim_attributes, values, geo.prim_attrs,
+                         geo.prim_attr_string_dict, geo.prim_attr_string_index,
+                         "Prim")
+
+    return geo
+
+
+
+
+def load(path):
+    with open(path, "rb") as binary_file:
+        magic = binary_file.read(len(BINARY_MAGIC))
+        if magic != BINARY_MAGIC:
+            raise ValueError("'%s' is not a binary geometry file." % path)
+        (length, ) = struct.unpack("<I", binary_file.read(4))
+        header = json.loads(binary_file.read(length))
+    start = len(BINARY_MAGIC) + 4 + length
+
+    arrays = {}
+    for spec in header["arrays"]:
+        shape = tuple(spec["shape"])
+        if not np.prod(shape):
+            arrays[spec["name"]] = np.zeros(shape, dtype=spec["dtype"])
+            continue
+        arrays[spec["name"]] = np.memmap(
+            path, dtype=spec["dtype"], mode="c",
+            offset=start + spec["offset"], shape=shape)
+
+    geo = ArrayGeometry()
+    geo.point_column = wrap_column(arrays["points"])
+    geo.prim_vertices = wrap_column(arrays["prim_vertices"])
+    geo.prim_offsets = wrap_column(arrays["prim_offsets"])
+    geo.prim_closed = wrap_column(arrays["prim_closed"])
+
+    types = dict((value, key) for key, value in BINARY_TYPES.items())
+    for prefix, attributes, string_dict, string_index in (
+            ("point_attrs", geo.point_attrs,
+             geo.point_attr_string_dict, geo.point_attr_string_index),
+            ("prim_attrs", geo.prim_attrs,
+             geo.prim_attr_string_dict, geo.prim_attr_string_index),
+            ):
+        for spec in header[prefix]:
+            name = spec["name"]
+            attributes[name] = {
+                "type": types[spec["type"]],
+                "length": spec["length"],
+                "values": wrap_column(arrays["%s/%s" % (prefix, spec["name"])]),
+                "default": spec["default"],
+            }
+            if "strings" in spec:
+                string_dict[name] = list(spec["strings"])
+                string_index[name] = dict(
+                    (value, i) for i, value in enumerate(string_dict[name]))
+
+    return geo
+
+
+
+def read_any(path):
+    if path.endswith(".npgeo"):
+        return load(path)
+    return read_array(path)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import codecs
+import logging
+from optparse import OptionParser
+
+import numpy as np
+
+import geometry
+from geometry import ArrayGeometry
+from measure import ring_areas, ring_lengths, ring_centroids
+
+
+
+log = logging.getLogger('landpoints')
+
+
+
+def group_sum(ids, values, count):
+    return np.bincount(ids, values, minlength=count)
+
+
+
+def country_measures(land):
+    # Area (steradians) and perimeter (radians) on the unit sphere, and an
+    # area-weighted centroid in longitude/latitude, for each `iso2`.
+    codes = list(land.prim_attr_string_dict.get("iso2", []))
+    count = len(codes)
+    if not len(land.prims):
+        return codes, np.zeros(0), np.zeros(0), np.zeros((0, 2))
+
+    ids = land.prim_attr_array("iso2")
+    offsets = land.prim_offsets.array
+    points = land.points[land.prim_vertices.array]
+
+    signed_area = ring_areas(points, offsets)
+    total = group_sum(ids, signed_area, count)
+    area = np.abs(total)
+    perimeter = group_sum(ids, ring_lengths(points, offsets), count)
+
+    # Average ring centroids as unit vectors, weighted by spherical area
+    # (holes negative), so countries across the antimeridian stay whole.
+    centroid = ring_centroids(points, offsets)[1]
+    weight = signed_area * np.sign(total)[ids]
+    lon = np.radians(centroid[:, 0])
+    lat = np.radians(centroid[:, 1])
+    xyz = np.column_stack([
+        group_sum(ids, weight * np.cos(lat) * np.cos(lon), count),
+        group_sum(ids, weight * np.cos(lat) * np.sin(lon), count),
+        group_sum(ids, weight * np.sin(lat), count),
+    ])
+    xyz /= np.sqrt((xyz ** 2).sum(axis=1))[:, None]
+    uv = np.degrees(np.column_stack([
+        np.arctan2(xyz[:, 1], xyz[:, 0]),
+        np.arcsin(np.clip(xyz[:, 2], -1, 1)),
+    ]))
+
+    return codes, area, perimeter, uv
+
+
+
+def missing_positions(missing):
+    codes = list(missing.point_attr_string_dict.get("iso2", []))
+    if not codes:
+        return codes, np.zeros((0, 2))
+    ids = missing.point_attr_array("iso2")
+    count = np.bincount(ids, minlength=len(codes))
+    uv = np.column_stack([
+        np.bincount(ids, missing.points[:, 0], minlength=len(codes)),
+        np.bincount(ids, missing.points[:, 1], minlength=len(codes)),
+    ]) / count[:, None]
+    return codes, uv
+
+
+
+def land_points(land, missing):
+    # Countries with manual landmass positions in `missing` use those,
+    # averaged, in place of their polygon centroid.
+    codes, area, perimeter, uv = country_measures(land)
+    missing_codes, missing_uv = missing_positions(missing)
+
+    index = dict((code, i) for i, code in enumerate(codes))
+    extra = [code for code in missing_codes if code not in index]
+    for code in extra:
+        index[code] = len(codes)
+        codes.append(code)
+    area = np.concatenate([area, np.zeros(len(extra))])
+    perimeter = np.concatenate([perimeter, np.zeros(len(extra))])
+    uv = np.concatenate([uv, np.zeros((len(extra), 2))])
+    for code, position in zip(missing_codes, missing_uv):
+        uv[index[code]] = position
+
+    geo = ArrayGeometry()
+    geo.add_points(uv)
+    geo.set_point_attr_string_column("iso2", codes)
+    geo.set_point_attr_float_column("area", area)
+    geo.set_point_attr_float_column("perimeter", perimeter)
+    geo.set_point_attr_float_column(
+        "uv", np.column_stack([uv, np.zeros(len(uv))]))
+    log.info("%d countries, %d from missing landmasses only." % (
+        len(codes), len(extra)))
+    return geo
+
+
+
+def landpoints(world_geo_path, missing_geo_path, binary_path=None):
+    log.info(world_geo_path)
+    land = geometry.read_any(world_geo_path)
+    log.info(missing_geo_path)
+    missing = geometry.read_any(missing_geo_path)
+
+    geo = land_points(land, missing)
+    geo.write(codecs.getwriter("utf-8")(sys.stdout))
+    if binary_path:
+        geo.save(binary_path)
+
+
+
+def main():
+    log.addHandler(logging.StreamHandler())
+
+    usage = """%prog WORLD MISSING
+
+WORLD      Country polygons from `worldgeo.py`, as .geo or .npgeo.
+MISSING    Landmass points from `missinggeo.py`, as .geo or .npgeo.
+
+Write one point per country with `iso2`, `area`, `perimeter` and `uv`
+attributes, in place of Houdini's `world-3d-points.geo`.
+"""
+
+    parser = OptionParser(usage=usage)
+    parser.add_option("-v", "--verbose", action="count", dest="verbose",
+                      help="Print verbose information for debugging.", default=0)
+    parser.add_option("-q", "--quiet", action="count", dest="quiet",
+                      help="Suppress warnings.", default=0)
+    parser.add_option("-b", "--binary", action="store", dest="binary",
+                      help="Also save geometry to a binary sidecar at this path.", default=None)
+
+    (options, args) = parser.parse_args()
+    args = [arg.decode(sys.getfilesystemencoding()) for arg in args]
+
+    log_level = (logging.ERROR, logging.WARNING, logging.INFO, logging.DEBUG,)[
+        max(0, min(3, 1 + options.verbose - options.quiet))]
+
+    log.setLevel(log_level)
+
+    if not len(args) == 2:
+        parser.print_usage()
+        sys.exit(1)
+
+    (world_geo_path, missing_geo_path) = args
+
+    landpoints(world_geo_path, missing_geo_path, options.binary)
+    
+    
+
+if __name__ == "__main__":
+    main()
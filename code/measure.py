@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Vectorized measurements of rings and polylines stored CSR-style, as a
+# longitude/latitude point array in degrees plus ring offsets. Lengths are
+# in radians and areas in steradians, ie. on the unit sphere.
+
+import numpy as np
+
+
+
+def ring_ids(offsets):
+    offsets = np.asarray(offsets)
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+
+def segment_ends(offsets, closed=True):
+    # Index of the start and end point of every segment. Closed rings wrap
+    # their last point back to their first.
+    offsets = np.asarray(offsets)
+    count = offsets[-1]
+    start = np.arange(count)
+    end = start + 1
+    last = offsets[1:][np.diff(offsets) > 0] - 1
+    if closed:
+        end[last] = offsets[:-1][np.diff(offsets) > 0]
+        return start, end
+    keep = np.ones(count, dtype=bool)
+    keep[last] = False
+    return start[keep], end[keep]
+
+
+
+def arc_lengths(points, start, end):
+    lon = np.radians(points[:, 0])
+    lat = np.radians(points[:, 1])
+    dlon = lon[end] - lon[start]
+    dlat = lat[end] - lat[start]
+    h = (np.sin(dlat / 2) ** 2 +
+         np.cos(lat[start]) * np.cos(lat[end]) * np.sin(dlon / 2) ** 2)
+    return 2 * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+
+
+def ring_lengths(points, offsets, closed=True):
+    start, end = segment_ends(offsets, closed)
+    lengths = arc_lengths(points, start, end)
+    return np.bincount(ring_ids(offsets)[start], lengths,
+                       minlength=len(offsets) - 1)
+
+
+
+def ring_areas(points, offsets):
+    # Signed spherical area of each closed ring, positive when clockwise
+    # like shapefile outer rings, using the trapezoid form of the shoelace
+    # formula on the sphere (Chamberlain & Duquette).
+    start, end = segment_ends(offsets)
+    lon = np.radians(points[:, 0])
+    sin_lat = np.sin(np.radians(points[:, 1]))
+    dlon = lon[end] - lon[start]
+    dlon = (dlon + np.pi) % (2 * np.pi) - np.pi
+    terms = dlon * (2 + sin_lat[start] + sin_lat[end])
+    return np.bincount(ring_ids(offsets)[start], terms,
+                       minlength=len(offsets) - 1) / 2
+
+
+
+def ring_centroids(points, offsets):
+    # Planar shoelace area and centroid of each ring in
+    # longitude/latitude, relative to the ring's first point for precision.
+    start, end = segment_ends(offsets)
+    ids = ring_ids(offsets)
+    first = points[np.asarray(offsets)[:-1], :2]
+    xy = points[:, :2] - first[ids]
+    x0, y0 = xy[start, 0], xy[start, 1]
+    x1, y1 = xy[end, 0], xy[end, 1]
+    cross = x0 * y1 - x1 * y0
+    rings = len(offsets) - 1
+    area = np.bincount(ids, cross, minlength=rings) / 2
+    cx = np.bincount(ids, (x0 + x1) * cross, minlength=rings)
+    cy = np.bincount(ids, (y0 + y1) * cross, minlength=rings)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        centroid = np.column_stack([cx, cy]) / (6 * area[:, None])
+    degenerate = area == 0
+    if degenerate.any():
+        centroid[degenerate] = np.column_stack([
+            np.bincount(ids, xy[:, 0], minlength=rings),
+            np.bincount(ids, xy[:, 1], minlength=rings),
+        ])[degenerate] / np.maximum(np.diff(offsets), 1)[degenerate, None]
+    return area, centroid + first
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from shpreader import ShpReader
+
+
+
+PRECISION = 6
+
+
+
+def quantize_int(coords, n=PRECISION):
+    # Scaled integer coordinates, rounding half away from zero.
+    coords = np.asarray(coords, dtype=np.float64)
+    scaled = np.trunc(coords * 10 ** n + np.sign(coords) * .5)
+    assert not len(scaled) or np.abs(scaled).max() < 2 ** 63, \
+        "Coordinates too large for %d decimal places." % n
+    return scaled.astype(np.int64)
+
+
+
+def dequantize(coords, n=PRECISION):
+    return np.asarray(coords, dtype=np.float64) / 10 ** n
+
+
+
+def quantize(coords, n=PRECISION):
+    return dequantize(quantize_int(coords, n), n)
+
+
+
+def split_rings(points, parts):
+    if not len(points):
+        return []
+    bounds = list(parts) + [len(points)]
+    return [points[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+
+def iter_shape_rings(sf):
+    # One pass over shapes and records, yielding each record with its parts
+    # as views onto the mapped `.shp`. Records still come from `sf`, paired
+    # with shapes in order as `sf.shapeRecords()` pairs them.
+    shapes = ShpReader(sf.shp.name)
+    for s, (record, (points, parts)) in enumerate(zip(sf.records(), shapes.iter_shapes())):
+        yield s, record, split_rings(points, parts)
+
+
+
+def add_rings(geometry, rings, closed=True, precision=PRECISION):
+    if closed:
+        rings = [ring[:-1] for ring in rings]  # because it's closed
+    if not rings:
+        return []
+    points = np.concatenate(rings)
+    if precision is not None:
+        points = quantize(points, precision)
+    point_numbers = geometry.add_points(points)
+    return geometry.add_prim_batch(
+        point_numbers, [len(ring) for ring in rings], closed)
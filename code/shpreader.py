@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+# Shapes straight from a mapped `.shp`, using the `.shx` record index.
+# Coordinates are returned as `(n, 2)` float64 views onto the file and
+# parts as int32 views, so no per-point Python objects are made.
+
+import os
+import struct
+
+import numpy as np
+
+
+
+FILE_CODE = 9994
+HEADER_SIZE = 100
+RECORD_HEADER_SIZE = 8
+
+NULL = 0
+POINT_TYPES = (1, 11, 21)
+POLY_TYPES = (3, 5, 13, 15, 23, 25)  # PolyLine and Polygon, with Z or M
+MULTIPOINT_TYPES = (8, 18, 28)
+
+# Content offsets within a record: type, bounding box, then counts.
+BOX_OFFSET = 4
+COUNT_OFFSET = 36
+PARTS_OFFSET = 44
+RECORD_PREFIX_SIZE = PARTS_OFFSET
+
+
+
+def shapefile_path(path, extension):
+    return os.path.splitext(path)[0] + extension
+
+
+
+def read_header(data, path):
+    if len(data) < HEADER_SIZE:
+        raise ValueError("%s is too short to be a shapefile." % path)
+    (file_code, ) = struct.unpack(">i", data[:4].tostring())
+    if file_code != FILE_CODE:
+        raise ValueError("%s is not a shapefile." % path)
+    (shape_type, ) = struct.unpack("<i", data[32:36].tostring())
+    bbox = struct.unpack("<4d", data[36:68].tostring())
+    return shape_type, bbox
+
+
+
+class ShpReader(object):
+    def __init__(self, path):
+        self.path = shapefile_path(path, ".shp")
+        self.shp = np.memmap(self.path, dtype=np.uint8, mode="r")
+        self.shape_type, self.bbox = read_header(self.shp, self.path)
+
+        shx_path = shapefile_path(path, ".shx")
+        shx = np.memmap(shx_path, dtype=np.uint8, mode="r")
+        read_header(shx, shx_path)
+        index = np.ndarray(((len(shx) - HEADER_SIZE) // 8, 2), dtype=">i4",
+                           buffer=shx, offset=HEADER_SIZE)
+
+        # Offsets and lengths are in 16-bit words, to the record header.
+        self.offsets = index[:, 0].astype(np.int64) * 2 + RECORD_HEADER_SIZE
+        self.lengths = index[:, 1].astype(np.int64) * 2
+        self.read_record_headers()
+
+    def read_record_headers(self):
+        # Type and part and point counts of every record, gathered from
+        # the mapped file in one go.
+        n = len(self.offsets)
+        prefix = np.zeros((n, RECORD_PREFIX_SIZE), dtype=np.uint8)
+        size = np.minimum(self.lengths, RECORD_PREFIX_SIZE)
+        columns = np.arange(RECORD_PREFIX_SIZE)
+        mask = columns < size[:, None]
+        prefix[mask] = self.shp[(self.offsets[:, None] + columns)[mask]]
+
+        self.types = prefix[:, :4].copy().view("<i4").ravel()
+        counts = prefix[:, COUNT_OFFSET:PARTS_OFFSET].copy().view("<i4")
+        poly = np.in1d(self.types, POLY_TYPES)
+        multipoint = np.in1d(self.types, MULTIPOINT_TYPES)
+        point = np.in1d(self.types, POINT_TYPES)
+
+        self.num_parts = np.where(poly, counts[:, 0], 0)
+        self.num_points = np.where(poly, counts[:, 1], 0)
+        self.num_points[multipoint] = counts[multipoint, 0]
+        self.num_points[point] = 1
+
+        unknown = ~(poly | multipoint | point | (self.types == NULL))
+        if unknown.any():
+            raise ValueError("%s has unsupported shape type %d." % (
+                self.path, self.types[unknown][0]))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def view(self, dtype, offset, shape):
+        return np.ndarray(shape, dtype=dtype, buffer=self.shp, offset=offset)
+
+    def shape(self, i):
+        # `(points, parts)` of record `i`, where `parts` are the start
+        # indexes of each part in `points`.
+        start = self.offsets[i]
+        type_ = self.types[i]
+        num_points = self.num_points[i]
+
+        if type_ in POLY_TYPES:
+            num_parts = self.num_parts[i]
+            parts = self.view("<i4", start + PARTS_OFFSET, (num_parts, ))
+            points = self.view("<f8", start + PARTS_OFFSET + 4 * num_parts, (num_points, 2))
+        elif type_ in MULTIPOINT_TYPES:
+            points = self.view("<f8", start + COUNT_OFFSET + 4, (num_points, 2))
+            parts = np.zeros(1, dtype=np.int32)
+        elif type_ in POINT_TYPES:
+            points = self.view("<f8", start + BOX_OFFSET, (1, 2))
+            parts = np.zeros(1, dtype=np.int32)
+        else:
+            points = np.empty((0, 2), dtype=np.float64)
+            parts = np.empty(0, dtype=np.int32)
+
+        return points, parts
+
+    def iter_shapes(self, start=0, stop=None):
+        for i in xrange(start, len(self) if stop is None else stop):
+            yield self.shape(i)
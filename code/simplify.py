@@ -0,0 +1,473 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Topology-preserving Douglas-Peucker simplification of the rings and
+# polylines in a `.geo` file. Rings are split into arcs at junctions,
+# where the vertices shared between rings stop running together, and each
+# arc is simplified once in a canonical direction. Whether to keep a
+# vertex is decided per quantized position, so a border shared by two
+# countries keeps exactly the same vertices on both sides. Dropped
+# vertices are put back where a simplified arc would pass another vertex,
+# so arcs do not cross each other or swallow a neighbouring ring.
+
+import sys
+import codecs
+import logging
+import multiprocessing
+from optparse import OptionParser
+
+import numpy as np
+
+import geometry
+from geometry import ArrayGeometry
+from measure import ring_ids, ring_areas, ring_lengths
+from shpingest import PRECISION
+from topology import vertex_table, set_freq
+
+
+
+log = logging.getLogger('simplify')
+
+
+
+TOLERANCE = 0.01  # Degrees
+CHUNK_POINTS = 100000
+
+
+
+def line_distance(points, start, end):
+    # Distance of each point from the line through `start` and `end`, or
+    # from `start` where they meet.
+    d = end - start
+    p = points - start
+    length = np.hypot(d[:, 0], d[:, 1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(
+            length > 0,
+            np.abs(d[:, 0] * p[:, 1] - d[:, 1] * p[:, 0]) / length,
+            np.hypot(p[:, 0], p[:, 1]))
+
+
+
+def douglas_peucker(points, offsets, tolerance):
+    # Keep mask for polylines stored CSR-style, always keeping their ends.
+    # Every span still to be split, across all the polylines, is split in
+    # one vectorized step at its first farthest point, so the result is
+    # the same as splitting one span at a time. A polyline that starts and
+    # ends at the same point splits at its farthest point from it.
+    keep = np.zeros(len(points), dtype=bool)
+    keep[offsets[:-1]] = True
+    keep[offsets[1:] - 1] = True
+    active = ~keep
+
+    while active.any():
+        index = np.flatnonzero(active)
+        kept = np.flatnonzero(keep)
+        position = np.searchsorted(kept, index)
+        start = kept[position - 1]
+        end = kept[position]
+
+        distance = line_distance(points[index], points[start], points[end])
+
+        # Points are in order, so each span's points are a contiguous run.
+        span = np.concatenate([[0], np.cumsum(np.diff(start) != 0)])
+        first = np.flatnonzero(np.diff(np.append(-1, span)))
+        largest = np.maximum.reduceat(distance, first)
+        candidates = np.flatnonzero(distance == largest[span])
+        leading = np.ones(len(candidates), dtype=bool)
+        leading[1:] = span[candidates][1:] != span[candidates][:-1]
+        farthest = candidates[leading]
+        split = distance[farthest] > tolerance
+
+        keep[index[farthest[split]]] = True
+        active[index[farthest[split]]] = False
+        active[index[~split[span]]] = False
+
+    return keep
+
+
+
+def simplify_arcs(args):
+    points, offsets, tolerance = args
+    return douglas_peucker(points, offsets, tolerance)
+
+
+
+def junctions(vertex_ids, offsets, closed, count):
+    # Vertices where rings meet or part: those seen with more than one pair
+    # of neighbours, and the ends of open polylines.
+    ids = ring_ids(offsets)
+    index = np.arange(len(vertex_ids))
+    first = offsets[:-1][ids]
+    last = offsets[1:][ids] - 1
+    previous = np.where(index == first, last, index - 1)
+    following = np.where(index == last, first, index + 1)
+
+    a = vertex_ids[previous]
+    b = vertex_ids[following]
+    pairs = np.unique(np.column_stack([
+        vertex_ids, np.minimum(a, b), np.maximum(a, b)]), axis=0)
+    result = np.bincount(pairs[:, 0], minlength=count) > 1
+
+    ends = ~closed[ids] & ((index == first) | (index == last))
+    result[vertex_ids[ends]] = True
+    return result
+
+
+
+def ring_arcs(ring, is_junction, closed):
+    # Vertex id sequences of the arcs between junctions in one ring.
+    # Closed rings repeat their first vertex at the end, and a ring with no
+    # junctions starts at its lowest vertex id so both rings of a shared
+    # loop, eg. an enclave, split it the same way.
+    cut = np.flatnonzero(is_junction[ring])
+    if closed:
+        m = len(ring)
+        start = cut[0] if len(cut) else ring.argmin()
+        ring = np.roll(ring, -start)
+        ring = np.append(ring, ring[0])
+        cut = np.union1d((cut - start) % m, [0, m])
+    return [ring[i:j + 1] for i, j in zip(cut[:-1], cut[1:])]
+
+
+
+def canonical(arc):
+    # The same arc traced from either end gives the same sequence.
+    if arc[0] > arc[-1] or (arc[0] == arc[-1] and len(arc) > 2 and arc[1] > arc[-2]):
+        return arc[::-1]
+    return arc
+
+
+
+def unique_arcs(vertex_ids, offsets, closed, is_junction):
+    seen = set()
+    arcs = []
+    for prim, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+        if end - start < 2:
+            continue
+        for arc in ring_arcs(vertex_ids[start:end], is_junction, closed[prim]):
+            arc = canonical(arc)
+            key = arc.tostring()
+            if key not in seen:
+                seen.add(key)
+                arcs.append(arc)
+    return arcs
+
+
+
+def chunks(arcs, size=CHUNK_POINTS):
+    chunk = []
+    total = 0
+    for arc in arcs:
+        chunk.append(arc)
+        total += len(arc)
+        if total >= size:
+            yield chunk
+            chunk = []
+            total = 0
+    if chunk:
+        yield chunk
+
+
+
+def expand(start, count):
+    # The runs `start[i]`, `start[i] + 1`, ... of length `count[i]`, laid
+    # end to end, and the `i` of each.
+    owner = np.repeat(np.arange(len(start)), count)
+    first = np.cumsum(count) - count
+    return start[owner] + np.arange(len(owner)) - first[owner], owner
+
+
+
+def enclosing_spans(points, ids, start, end):
+    # Which spans between kept positions `start` and `end` of the arc
+    # vertex ids `ids` enclose a vertex that is not on them, inside the
+    # ring their dropped vertices make with the segment that replaces
+    # them. Candidates are gathered from a grid of about the size of a
+    # span.
+    count = end - start + 1
+    member, span = expand(start, count)
+    vertex = ids[member]
+    xy = points[vertex]
+    first = np.cumsum(count) - count
+    lo = np.column_stack([np.minimum.reduceat(xy[:, i], first) for i in (0, 1)])
+    hi = np.column_stack([np.maximum.reduceat(xy[:, i], first) for i in (0, 1)])
+    cell = np.median((hi - lo).max(axis=1))
+    if not cell > 0:
+        return np.zeros(len(start), dtype=bool)
+
+    origin = points.min(axis=0)
+    grid = np.floor((points - origin) / cell).astype(np.int64)
+    rows = grid[:, 1].max() + 1
+    keys = grid[:, 0] * rows + grid[:, 1]
+    order = np.argsort(keys, kind="mergesort")
+    keys = keys[order]
+
+    # Each grid column a span covers is one run of sorted keys.
+    cell_lo = np.floor((lo - origin) / cell).astype(np.int64)
+    cell_hi = np.floor((hi - origin) / cell).astype(np.int64)
+    column, owner = expand(cell_lo[:, 0], cell_hi[:, 0] - cell_lo[:, 0] + 1)
+    key_lo = np.searchsorted(keys, column * rows + cell_lo[owner, 1])
+    key_hi = np.searchsorted(keys, column * rows + cell_hi[owner, 1], side="right")
+    candidate, pair = expand(key_lo, key_hi - key_lo)
+    pair_span = owner[pair]
+    pair_vertex = order[candidate]
+
+    p = points[pair_vertex]
+    inside = ((p >= lo[pair_span]) & (p <= hi[pair_span])).all(axis=1)
+    on_span = np.unique(span * len(points) + vertex)
+    key = pair_span * len(points) + pair_vertex
+    inside &= on_span[np.minimum(np.searchsorted(on_span, key), len(on_span) - 1)] != key
+    pair_span = pair_span[inside]
+    p = p[inside]
+
+    # Crossing number of each candidate against the edges of its span's
+    # ring, the last closing it back to the start.
+    following = np.arange(len(member)) + 1
+    following[first + count - 1] = first
+    edge, pair = expand(first[pair_span], count[pair_span])
+    a = xy[edge]
+    b = xy[following[edge]]
+    q = p[pair]
+    crosses = (a[:, 1] > q[:, 1]) != (b[:, 1] > q[:, 1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = a[:, 0] + (q[:, 1] - a[:, 1]) * (b[:, 0] - a[:, 0]) / (b[:, 1] - a[:, 1])
+    hits = np.bincount(pair, crosses & (q[:, 0] < x), minlength=len(pair_span))
+    return np.bincount(pair_span[hits % 2 == 1], minlength=len(start)) > 0
+
+
+
+def farthest_dropped(points, ids, start, end):
+    # Position of the first dropped vertex farthest from each span's
+    # segment.
+    member, span = expand(start + 1, end - start - 1)
+    distance = line_distance(points[ids[member]], points[ids[start[span]]],
+                             points[ids[end[span]]])
+    order = np.lexsort((member, -distance, span))
+    leading = np.ones(len(order), dtype=bool)
+    leading[1:] = span[order][1:] != span[order][:-1]
+    return member[order[leading]]
+
+
+
+def restore_enclosed(points, arcs, keep):
+    # Put dropped vertices back until no simplified span encloses another
+    # vertex, taking the farthest from any span that does. Spans are
+    # tested against the original vertices, so only the ones just split
+    # need testing again.
+    if not arcs:
+        return 0
+    ids = np.concatenate(arcs)
+    arc = ring_ids(np.cumsum([0] + [len(a) for a in arcs]))
+    kept = np.flatnonzero(keep[ids])
+    start, end = kept[:-1], kept[1:]
+    spans = (arc[start] == arc[end]) & (end - start > 1)
+    start, end = start[spans], end[spans]
+
+    restored = 0
+    while len(start):
+        enclosing = enclosing_spans(points, ids, start, end)
+        start, end = start[enclosing], end[enclosing]
+        split = farthest_dropped(points, ids, start, end)
+        keep[ids[split]] = True
+        restored += len(split)
+        start, end = np.append(start, split), np.append(split, end)
+        spans = end - start > 1
+        start, end = start[spans], end[spans]
+    return restored
+
+
+
+def keep_vertices(table, offsets, closed, tolerance, jobs=None):
+    # Keep flag for each vertex in the `topology.vertex_table`. Arcs are
+    # simplified in chunks of whole rings, in parallel.
+    vertex_ids = table.inverse
+    count = len(table.points)
+    is_junction = junctions(vertex_ids, offsets, closed, count)
+    arcs = unique_arcs(vertex_ids, offsets, closed, is_junction)
+    log.info("%d vertices, %d junctions, %d arcs" % (
+        count, is_junction.sum(), len(arcs)))
+
+    arc_chunks = list(chunks(arcs))
+    work = [(table.points[np.concatenate(chunk)],
+             np.cumsum([0] + [len(arc) for arc in chunk]),
+             tolerance)
+            for chunk in arc_chunks]
+    if jobs == 1 or len(work) < 2:
+        masks = map(simplify_arcs, work)
+    else:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            masks = pool.map(simplify_arcs, work)
+        finally:
+            pool.close()
+            pool.join()
+
+    keep = is_junction.copy()
+    for chunk, mask in zip(arc_chunks, masks):
+        keep[np.concatenate(chunk)[mask]] = True
+
+    restored = restore_enclosed(table.points, arcs, keep)
+    log.info("%d vertices kept so arcs do not cross" % restored)
+
+    # Rings that would collapse keep every vertex, and so do the rings
+    # they share them with.
+    kept = np.bincount(ring_ids(offsets), keep[vertex_ids], minlength=len(closed))
+    collapsed = closed & (kept < 3)
+    if collapsed.any():
+        keep[vertex_ids[collapsed[ring_ids(offsets)]]] = True
+
+    return keep
+
+
+
+def copy_attrs(source, target, attributes, string_dict, obj, index):
+    for name, attr in attributes.items():
+        values = getattr(source, "%s_attr_array" % obj)(name)[index]
+        if attr["type"] == str:
+            strings = string_dict[name]
+            values = [strings[value] for value in values]
+        setter = getattr(target, "set_%s_attr_%s_column" % (
+            obj, {int: "int", float: "float", str: "string"}[attr["type"]]))
+        setter(name, values)
+
+
+
+def measures(points, offsets, closed, ids, count):
+    perimeter = np.bincount(ids, ring_lengths(points, offsets, closed.all()),
+                            minlength=count)
+    if not closed.all():
+        return None, perimeter
+    area = np.abs(np.bincount(ids, ring_areas(points, offsets), minlength=count))
+    return area, perimeter
+
+
+
+def relative_error(before, after):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        error = np.abs(after - before) / before
+    return np.where(before > 0, error, 0)
+
+
+
+def report_errors(source, result):
+    # Total and worst-case relative area and perimeter error, by the
+    # `iso2` prim attribute if there is one, otherwise by prim.
+    if "iso2" in source.prim_attrs:
+        ids = source.prim_attr_array("iso2")
+        names = source.prim_attr_string_dict["iso2"]
+    else:
+        ids = np.arange(len(source.prim_closed))
+        names = [str(i) for i in ids]
+    count = len(names)
+    closed = source.prim_closed.array
+
+    before = measures(source.points[source.prim_vertices.array],
+                      source.prim_offsets.array, closed, ids, count)
+    after = measures(result.points[result.prim_vertices.array],
+                     result.prim_offsets.array, closed, ids, count)
+
+    errors = {}
+    for label, b, a in zip(("area", "perimeter"), before, after):
+        if b is None:
+            continue
+        error = relative_error(b, a)
+        worst = error.argmax()
+        errors[label] = (abs(a.sum() - b.sum()) / b.sum(), error[worst], names[worst])
+        log.warning("%s error %.4f%% total, %.4f%% at worst (%s)" % (
+            label, 100 * errors[label][0], 100 * errors[label][1], names[worst]))
+    return errors
+
+
+
+def simplify(source, tolerance=TOLERANCE, precision=PRECISION, jobs=None):
+    geo = ArrayGeometry()
+    if not len(source.prim_closed):
+        return geo
+
+    vertices = source.prim_vertices.array
+    offsets = source.prim_offsets.array
+    closed = source.prim_closed.array
+    table = vertex_table(source.points[vertices, :2], precision)
+    keep = keep_vertices(table, offsets, closed, tolerance, jobs)[table.inverse]
+
+    kept = vertices[keep]
+    counts = np.bincount(ring_ids(offsets)[keep], minlength=len(closed))
+    geo.add_points(source.points[kept])
+    prims = geo.add_prim_batch(np.arange(len(kept)), counts)
+    geo.prim_closed.data[prims] = closed
+
+    copy_attrs(source, geo, source.point_attrs, source.point_attr_string_dict,
+               "point", kept)
+    copy_attrs(source, geo, source.prim_attrs, source.prim_attr_string_dict,
+               "prim", np.arange(len(closed)))
+    if "freq" in source.point_attrs:
+        set_freq(geo, precision)
+
+    log.warning("%d of %d vertices kept, %.1fx fewer" % (
+        len(kept), len(vertices), float(len(vertices)) / max(len(kept), 1)))
+    report_errors(source, geo)
+
+    return geo
+
+
+
+def simplify_geo(geo_path, tolerance=TOLERANCE, binary_path=None,
+                 precision=PRECISION, jobs=None):
+    log.info(geo_path)
+    source = geometry.read_any(geo_path)
+
+    geo = simplify(source, tolerance, precision, jobs)
+    geo.write(codecs.getwriter("utf-8")(sys.stdout))
+    if binary_path:
+        geo.save(binary_path)
+
+
+
+def main():
+    log.addHandler(logging.StreamHandler())
+
+    usage = """%prog GEO
+
+GEO    Rings or polylines from `worldgeo.py` or `bordergeo.py`, as .geo or
+       .npgeo.
+
+Simplify the geometry, keeping shared borders identical on both sides,
+and write it as .geo.
+"""
+
+    parser = OptionParser(usage=usage)
+    parser.add_option("-v", "--verbose", action="count", dest="verbose",
+                      help="Print verbose information for debugging.", default=0)
+    parser.add_option("-q", "--quiet", action="count", dest="quiet",
+                      help="Suppress warnings.", default=0)
+    parser.add_option("-t", "--tolerance", action="store", dest="tolerance", type="float",
+                      help="Largest distance in degrees a removed vertex may lie from the simplified line. Default %g." % TOLERANCE, default=TOLERANCE)
+    parser.add_option("-b", "--binary", action="store", dest="binary",
+                      help="Also save geometry to a binary sidecar at this path.", default=None)
+    parser.add_option("-p", "--precision", action="store", dest="precision", type="int",
+                      help="Decimal places vertices are matched to. Default %d." % PRECISION, default=PRECISION)
+    parser.add_option("-j", "--jobs", action="store", dest="jobs", type="int",
+                      help="Worker processes. Default is one per core.", default=None)
+
+    (options, args) = parser.parse_args()
+    args = [arg.decode(sys.getfilesystemencoding()) for arg in args]
+
+    log_level = (logging.ERROR, logging.WARNING, logging.INFO, logging.DEBUG,)[
+        max(0, min(3, 1 + options.verbose - options.quiet))]
+
+    log.setLevel(log_level)
+
+    if not len(args) == 1:
+        parser.print_usage()
+        sys.exit(1)
+
+    (geo_path, ) = args
+
+    simplify_geo(geo_path, options.tolerance, options.binary,
+                 options.precision, options.jobs)
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+
+import numpy as np
+
+from shpingest import PRECISION, quantize_int
+
+
+
+# `points` are the unique vertices, `inverse` maps each geometry point to
+# its row in `points` and `counts` is how many geometry points share it.
+VertexTable = namedtuple("VertexTable", ("points", "inverse", "counts"))
+
+
+
+def vertex_table(points, precision=PRECISION):
+    points = np.asarray(points, dtype=np.float64)
+    if not len(points):
+        empty = np.zeros(0, dtype=np.int64)
+        return VertexTable(points, empty, empty)
+    keys = quantize_int(points, precision)
+    unique, index, inverse, counts = np.unique(
+        keys, axis=0,
+        return_index=True, return_inverse=True, return_counts=True)
+    return VertexTable(points[index], inverse, counts)
+
+
+
+def set_freq(geometry, precision=PRECISION):
+    # Point attribute `freq`: the number of points sharing the same
+    # quantized position, eg. 2 along a border between two countries.
+    table = vertex_table(geometry.points, precision)
+    geometry.set_point_attr_int_column('freq', table.counts[table.inverse])
+    return table
@@ -5,11 +5,12 @@ import sys
 import codecs
 import logging
 from optparse import OptionParser
-from collections import defaultdict
 
 import shapefile
 
-from geometry import Geometry
+from geometry import ArrayGeometry
+from shpingest import PRECISION, iter_shape_rings, add_rings
+from topology import set_freq
 
 
 
@@ -21,25 +22,18 @@ log = logging.getLogger('bordergeo')
 
 
 
-def trunc(f, n=6):
-    m = 10**n
-    return float(int(f * m + float(cmp(f, 0))*.5)) / m
-
-
-
-def shp2geo(sf, iso32, border_switch, border_deny):
-    geometry = Geometry()
+def shp2geo(sf, iso32, border_switch, border_deny, precision=PRECISION):
+    geometry = ArrayGeometry()
 
     index_iso3_left = sf.get_field("adm0_a3_l")
     index_iso3_right = sf.get_field("adm0_a3_r")
     index_type = sf.get_field("type")
 
     p = 0
-    for s, shaperecord in enumerate(sf.records()):
-        shaperecord = sf.shapeRecord(s)
-        iso3_left = shaperecord.record[index_iso3_left]
-        iso3_right = shaperecord.record[index_iso3_right]
-        type_ = shaperecord.record[index_type]
+    for s, record, rings in iter_shape_rings(sf):
+        iso3_left = record[index_iso3_left]
+        iso3_right = record[index_iso3_right]
+        type_ = record[index_type]
 
         try:
             iso2_left = iso32[iso3_left]
@@ -55,7 +49,7 @@ def shp2geo(sf, iso32, border_switch, border_deny):
             log.warning("switch %s -> %s" % (repr(border_key), repr(border_switch[border_key])))
             iso2_left, iso2_right = border_switch[border_key]
             border_key = tuple(sorted([iso2_left, iso2_right]))            
-            log.info(shaperecord.shape.parts)
+            log.info(repr([len(ring) for ring in rings]))
 
         if border_key in border_deny:
             log.warning("inhibit %s" % repr(border_key))
@@ -64,42 +58,28 @@ def shp2geo(sf, iso32, border_switch, border_deny):
         if iso2_left == iso2_right:
             continue
 
-        if hasattr(shaperecord.shape, "parts"):
-            parts = shaperecord.shape.parts
-        else:
+        if not rings:
             log.warning(s)
-            parts = []
-        part_shapes = []
-        for i, point in enumerate(shaperecord.shape.points):
-            if i in parts:
-                part_shapes.append([])
-            part_shapes[-1].append(point)
-        p += len(part_shapes)
-        for part_shape in part_shapes:
-            point_numbers = []
-            for point in part_shape[:]:  # because it's open
-                point_number = geometry.add_point(trunc(point[0]), trunc(point[1]), 0.0)
-                point_numbers.append(point_number)
-            prim_number = geometry.add_prim(point_numbers, closed=False)
-            
+        p += len(rings)
+        for prim_number in add_rings(geometry, rings, closed=False,
+                                     precision=precision):
             geometry.set_prim_attr_string('iso2_left', prim_number, iso2_left)
             geometry.set_prim_attr_string('iso2_right', prim_number, iso2_right)
             geometry.set_prim_attr_string('type', prim_number, type_)
             geometry.set_prim_attr_int('prim', prim_number, prim_number)
 
-    d = defaultdict(int)
-    for p, point in enumerate(geometry.points):
-        d[point] += 1
-    for p, point in enumerate(geometry.points):
-        geometry.set_point_attr_int('freq', p, d[point])
-    
+    set_freq(geometry, precision)
+
     return geometry
 
 
 
-def dump_geo(sf, iso32, border_deny, border_switch):
-    geometry = shp2geo(sf, iso32, border_deny, border_switch)
-    print geometry.render()
+def dump_geo(sf, iso32, border_deny, border_switch, binary_path=None,
+             precision=PRECISION):
+    geometry = shp2geo(sf, iso32, border_deny, border_switch, precision)
+    geometry.write(sys.stdout)
+    if binary_path:
+        geometry.save(binary_path)
 
 
 
@@ -154,7 +134,8 @@ def get_border(csv_file, is_dict=False):
 
 
 def worldgeo(shp_path, iso_csv_path,
-             border_switch_csv_path, border_deny_csv_path):
+             border_switch_csv_path, border_deny_csv_path, binary_path=None,
+             precision=PRECISION):
     log.info(shp_path)
     sf = shapefile.Reader(shp_path)
     attach_field_index(sf)
@@ -171,7 +152,7 @@ def worldgeo(shp_path, iso_csv_path,
     with codecs.open(border_deny_csv_path, "r", "utf-8") as csv_file:
         border_deny = get_border(csv_file)
 
-    dump_geo(sf, iso32, border_switch, border_deny)
+    dump_geo(sf, iso32, border_switch, border_deny, binary_path, precision)
 
 
 
@@ -191,6 +172,10 @@ BORDERS_DENY_CSV  CSV of ISO2 codes of borders to inhibit.
                       help="Print verbose information for debugging.", default=0)
     parser.add_option("-q", "--quiet", action="count", dest="quiet",
                       help="Suppress warnings.", default=0)
+    parser.add_option("-b", "--binary", action="store", dest="binary",
+                      help="Also save geometry to a binary sidecar at this path.", default=None)
+    parser.add_option("-p", "--precision", action="store", dest="precision", type="int",
+                      help="Decimal places to round coordinates to. Default %d." % PRECISION, default=PRECISION)
 
     (options, args) = parser.parse_args()
     args = [arg.decode(sys.getfilesystemencoding()) for arg in args]
@@ -206,7 +191,8 @@ BORDERS_DENY_CSV  CSV of ISO2 codes of borders to inhibit.
 
     (shp_path, iso_csv_path, border_switch_csv_path, border_deny_csv_path) = args
 
-    worldgeo(shp_path, iso_csv_path, border_switch_csv_path, border_deny_csv_path)
+    worldgeo(shp_path, iso_csv_path, border_switch_csv_path, border_deny_csv_path,
+             options.binary, options.precision)
     
     
 
@@ -0,0 +1 @@
+../../../code/borderpoints.py
\ No newline at end of file
@@ -16,7 +16,7 @@ delimiter = ";"
 
 
 
-def html2csv(html_path):
+def html_rows(html_path):
     with open(html_path) as html_file:
         soup = BeautifulSoup(html_file)
         appendix = soup.find("ul", {"id": "GetAppendix_D"})
@@ -33,7 +33,13 @@ def html2csv(html_path):
             row = [td.text for td in table_iso.find_all("td")] + [name]
             if row[0] in ("-", u'\xa0'):
                 continue
-            sys.stdout.write(("%s\n" % (delimiter + " ").join(row)).encode("utf-8"))
+            yield row
+
+
+
+def html2csv(html_path):
+    for row in html_rows(html_path):
+        sys.stdout.write(("%s\n" % (delimiter + " ").join(row)).encode("utf-8"))
 
 
 
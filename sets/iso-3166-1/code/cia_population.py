@@ -32,10 +32,9 @@ def row_iter(path, delimiter=DELIMITER):
 
 
 
-def text2csv(text_path, csv_path):
-
+def population_rows(text_path, code_rows):
     names2iso2 = {}
-    for row in row_iter(csv_path):
+    for row in code_rows:
         names2iso2[row[3]] = row[0]
 
     for rank, name, population in row_iter(text_path, delimiter="\t"):
@@ -49,6 +48,12 @@ def text2csv(text_path, csv_path):
         row = [iso2, unicode(population), name]
         if row[0] in ("-", u'\xa0'):
             continue
+        yield row
+
+
+
+def text2csv(text_path, csv_path):
+    for row in population_rows(text_path, row_iter(csv_path)):
         sys.stdout.write(("%s\n" % (DELIMITER + " ").join(row)).encode("utf-8"))
 
 
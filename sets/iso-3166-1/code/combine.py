@@ -0,0 +1 @@
+../../../code/combine.py
\ No newline at end of file
@@ -7,6 +7,7 @@ import codecs
 import logging
 from optparse import OptionParser
 
+import dotsbin
 import geometry
 
 
@@ -16,38 +17,17 @@ DELIMITER = ";"
 
 
 
-def compile_json(land_geo_path, border_geo_path,
-                 name_csv_path, group_csv_path, population_csv_path):
-    land = geometry.read(land_geo_path)
-    border = geometry.read(border_geo_path)
-
-    names = {}
-    with codecs.open(name_csv_path, "r", "utf-8") as csv_file:
+def read_table(csv_path):
+    with codecs.open(csv_path, "r", "utf-8") as csv_file:
         for line in csv_file:
             line = line.strip()
             if not line:
                 continue
-            iso2, name = line.split(DELIMITER + " ")
-            names[iso2] = name
+            yield line.split(DELIMITER + " ")
 
-    groups = {}
-    with codecs.open(group_csv_path, "r", "utf-8") as csv_file:
-        for line in csv_file:
-            line = line.strip()
-            if not line:
-                continue
-            iso2, group = line.split(DELIMITER + " ")[:2]
-            groups[iso2] = group
 
-    populations = {}
-    with codecs.open(population_csv_path, "r", "utf-8") as csv_file:
-        for line in csv_file:
-            line = line.strip()
-            if not line:
-                continue
-            iso2, population = line.split(DELIMITER + " ")[:2]
-            populations[iso2] = int(population)
 
+def compile_data(land, border, names, groups, populations):
     data = {
         "nodes": [],
         "links": [],
@@ -92,8 +72,38 @@ def compile_json(land_geo_path, border_geo_path,
             "y": lon,
         })
 
+    return data
+
+
+
+def compile_json(land_geo_path, border_geo_path,
+                 name_csv_path, group_csv_path, population_csv_path,
+                 binary_path=None):
+    land = geometry.read_any(land_geo_path)
+    border = geometry.read_any(border_geo_path)
+
+    names = {}
+    for iso2, name in read_table(name_csv_path):
+        names[iso2] = name
+
+    groups = {}
+    for row in read_table(group_csv_path):
+        iso2, group = row[:2]
+        groups[iso2] = group
+
+    populations = {}
+    for row in read_table(population_csv_path):
+        iso2, population = row[:2]
+        populations[iso2] = int(population)
+
+    data = compile_data(land, border, names, groups, populations)
+
     json.dump(data, sys.stdout, indent=2)
 
+    if binary_path:
+        with open(binary_path, "wb") as binary_file:
+            dotsbin.dump_dots(binary_file, data)
+
 
 
 if __name__ == "__main__":
@@ -106,6 +116,8 @@ if __name__ == "__main__":
                       help="Print verbose information for debugging.", default=0)
     parser.add_option("-q", "--quiet", action="count", dest="quiet",
                       help="Suppress warnings.", default=0)
+    parser.add_option("-b", "--binary", action="store", dest="binary",
+                      help="Also write columnar binary to this path.", default=None)
 
     (options, args) = parser.parse_args()
     args = [arg.decode(sys.getfilesystemencoding()) for arg in args]
@@ -122,5 +134,6 @@ if __name__ == "__main__":
     land_geo_path, border_geo_path, name_csv_path, group_csv_path, population_csv_path = args
 
     compile_json(land_geo_path, border_geo_path,
-                 name_csv_path, group_csv_path, population_csv_path)
+                 name_csv_path, group_csv_path, population_csv_path,
+                 options.binary)
 
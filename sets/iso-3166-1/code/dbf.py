@@ -0,0 +1 @@
+../../../code/dbf.py
\ No newline at end of file
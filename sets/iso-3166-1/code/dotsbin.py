@@ -0,0 +1 @@
+../../../code/dotsbin.py
\ No newline at end of file
@@ -0,0 +1 @@
+../../../code/landpoints.py
\ No newline at end of file
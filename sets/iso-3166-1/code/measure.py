@@ -0,0 +1 @@
+../../../code/measure.py
\ No newline at end of file
@@ -6,9 +6,10 @@ import sys
 import codecs
 import logging
 from optparse import OptionParser
-from collections import defaultdict
 
-from geometry import Geometry
+from geometry import ArrayGeometry
+from shpingest import PRECISION, iter_shape_rings, add_rings
+from topology import set_freq
 
 
 
@@ -20,56 +21,36 @@ log = logging.getLogger('worldgeo')
 
 
 
-def trunc(f, n=6):
-    m = 10**n
-    return float(int(f * m + float(cmp(f, 0))*.5)) / m
-
-
-
-def shp2geo(sf):
+def shp2geo(sf, precision=PRECISION):
+    geometry = ArrayGeometry()
     index_admin = sf.get_field("ADMIN")
     index_iso2 = sf.get_field("ISO_A3")
 
     p = 0
-    for s, shaperecord in enumerate(sf.records()):
-        shaperecord = sf.shapeRecord(s)
-        admin = shaperecord.record[index_admin]
-        iso2 = shaperecord.record[index_iso2]
-
-        parts = shaperecord.shape.parts
-        part_shapes = []
-        for i, point in enumerate(shaperecord.shape.points):
-            if i in parts:
-                part_shapes.append([])
-            part_shapes[-1].append(point)
-        p += len(part_shapes)
-        for part_shape in part_shapes:
-            point_numbers = []
-            for point in part_shape[:-1]:  # because it's closed
-                point_number = geometry.add_point(trunc(point[0]), trunc(point[1]), 0.0)
-                point_numbers.append(point_number)
-            prim_number = geometry.add_prim(point_numbers)
-            
+    for s, record, rings in iter_shape_rings(sf):
+        admin = record[index_admin]
+        iso2 = record[index_iso2]
+
+        p += len(rings)
+        for prim_number in add_rings(geometry, rings, precision=precision):
             geometry.set_prim_attr_string('iso2', prim_number, iso2)
             geometry.set_prim_attr_int('prim', prim_number, prim_number)
     log.warning(repr((s, p)))
 
-    d = defaultdict(int)
-    for p, point in enumerate(geometry.points):
-        d[point] += 1
-    for p, point in enumerate(geometry.points):
-        geometry.set_point_attr_int('freq', p, d[point])
-    
+    set_freq(geometry, precision)
+
     return geometry
 
 
 
-def missinggeo(csv_path):
+def csv2geo(csv_path):
     log.info(csv_path)
 
     with codecs.open(csv_path, "r", "utf-8") as csv_file:
-        geometry = Geometry()
-        p = 0
+        geometry = ArrayGeometry()
+        points = []
+        iso2_list = []
+        name_list = []
         for line in csv_file.read().splitlines():
             line = re.sub("#.*$", "", line)
             line = line.strip()
@@ -79,12 +60,23 @@ def missinggeo(csv_path):
             (iso2, name) = parts[:2]
             (latitude, longitude) = [float(value) for value in parts[2:]]
 
-            geometry.add_point(longitude, latitude, 0)
-            geometry.set_point_attr_string("iso2", p, iso2)
-            geometry.set_point_attr_string("name", p, name)
-            p += 1
+            points.append((longitude, latitude, 0))
+            iso2_list.append(iso2)
+            name_list.append(name)
+
+        geometry.add_points(points)
+        geometry.set_point_attr_string_column("iso2", iso2_list)
+        geometry.set_point_attr_string_column("name", name_list)
+
+    return geometry
+
+
 
-        sys.stdout.write(geometry.render().encode("utf-8"))
+def missinggeo(csv_path, binary_path=None):
+    geometry = csv2geo(csv_path)
+    geometry.write(codecs.getwriter("utf-8")(sys.stdout))
+    if binary_path:
+        geometry.save(binary_path)
 
 
 
@@ -101,6 +93,8 @@ CSV    CSV of missing country coordinates.
                       help="Print verbose information for debugging.", default=0)
     parser.add_option("-q", "--quiet", action="count", dest="quiet",
                       help="Suppress warnings.", default=0)
+    parser.add_option("-b", "--binary", action="store", dest="binary",
+                      help="Also save geometry to a binary sidecar at this path.", default=None)
 
     (options, args) = parser.parse_args()
     args = [arg.decode(sys.getfilesystemencoding()) for arg in args]
@@ -116,7 +110,7 @@ CSV    CSV of missing country coordinates.
 
     (csv_path, ) = args
 
-    missinggeo(csv_path)
+    missinggeo(csv_path, options.binary)
     
     
 
@@ -0,0 +1,593 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Build the data set's CSV, geometry and JSON targets in one process
+# pool. Stages run as soon as the stages they depend on are done, CSV
+# tables are handed between stages in memory, and a stage is skipped when
+# the hash of its sources, code and upstream stages matches the last run.
+
+import os
+import sys
+import json
+import time
+import codecs
+import hashlib
+import logging
+import multiprocessing
+from optparse import OptionParser
+
+
+
+log = logging.getLogger('pipeline')
+
+
+
+SET_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODE_PATH = os.path.join(SET_PATH, "code")
+STATE_PATH = os.path.join(SET_PATH, "data", "pipeline.json")
+
+COUNTRY = "sources/natural-earth/ne_10m_admin_0_countries"
+BORDER_LAND = "sources/natural-earth/ne_10m_admin_0_boundary_lines_land"
+
+# Options set by `configure` before the pool starts so workers share them.
+# Only those a stage lists in its `settings` change what it makes.
+SETTINGS = {
+    "tolerance": None,
+    "jobs": None,
+}
+
+
+
+def shapefile_paths(base):
+    return [base + extension for extension in (".shp", ".shx", ".dbf")]
+
+
+
+def set_path(path):
+    return os.path.join(SET_PATH, path)
+
+
+
+# Output
+
+
+
+def replace(path, write):
+    # Write through a temporary file so a failed stage leaves no partial
+    # output behind.
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    write(tmp_path)
+    os.rename(tmp_path, path)
+
+
+
+def write_csv(path, rows):
+    import combine
+
+    def write(tmp_path):
+        with open(tmp_path, "w") as csv_file:
+            combine.write_rows(csv_file, rows)
+    replace(path, write)
+
+
+
+def write_geo(geo_path, npgeo_path, geometry):
+    def write(tmp_path):
+        with codecs.open(tmp_path, "w", "utf-8") as geo_file:
+            geometry.write(geo_file)
+    replace(geo_path, write)
+    replace(npgeo_path, geometry.save)
+
+
+
+def read_csv(path):
+    import combine
+    return list(combine.row_iter(path))
+
+
+
+def load_csv(stage):
+    return read_csv(set_path(stage.outputs[0]))
+
+
+
+def load_world(stage):
+    return read_csv(set_path(stage.outputs[3]))
+
+
+
+def load_none(stage):
+    return None
+
+
+
+# Stages
+#
+# Each takes the stage and a dict of the results of the stages it depends
+# on, writes the stage's outputs and returns its result.
+
+
+
+def names_stage(stage, results):
+    # `cut -d ";" -f 1,4`
+    (source_path, ) = stage.sources
+    (output_path, ) = stage.outputs
+    lines = []
+    with codecs.open(set_path(source_path), "r", "utf-8") as csv_file:
+        for line in csv_file:
+            line = line.rstrip("\n")
+            if ";" in line:
+                line = ";".join(line.split(";")[0:4:3])
+            lines.append(line + "\n")
+
+    def write(tmp_path):
+        with codecs.open(tmp_path, "w", "utf-8") as csv_file:
+            csv_file.writelines(lines)
+    replace(set_path(output_path), write)
+    return read_csv(set_path(output_path))
+
+
+
+def codes_cia_stage(stage, results):
+    import cia_codes
+    rows = list(cia_codes.html_rows(set_path(stage.sources[0])))
+    write_csv(set_path(stage.outputs[0]), rows)
+    return rows
+
+
+
+def population_cia_stage(stage, results):
+    import cia_population
+    rows = list(cia_population.population_rows(
+        set_path(stage.sources[0]), results["codes.cia"]))
+    write_csv(set_path(stage.outputs[0]), rows)
+    return rows
+
+
+
+def combine_stage(stage, results):
+    # Complete list of names, then the generated table, then manual
+    # overrides, as `combine.py -c`.
+    import combine
+    (names, generated) = stage.depends
+    (manual_path, ) = stage.sources
+    rows = combine.combine_rows(
+        [results[generated], read_csv(set_path(manual_path))],
+        complete_rows=results[names])
+    write_csv(set_path(stage.outputs[0]), rows)
+    return rows
+
+
+
+def world_geo_stage(stage, results):
+    # Geometry, the name listing and groups from one pass over the
+    # country shapefile. The result is the groups table.
+    import shapefile
+    import worldgeo
+    geo_path, npgeo_path, names_path, groups_path = stage.outputs
+    sf = shapefile.Reader(set_path(stage.sources[0]))
+    worldgeo.attach_field_index(sf)
+    geometry, names, groups = worldgeo.ingest(sf)
+    write_geo(set_path(geo_path), set_path(npgeo_path), geometry)
+    write_csv(set_path(names_path), names)
+    write_csv(set_path(groups_path), groups)
+    return groups
+
+
+
+def border_geo_stage(stage, results):
+    import shapefile
+    import bordergeo
+    shp_path, shx_path, dbf_path, codes_path, switch_path, deny_path = stage.sources
+
+    sf = shapefile.Reader(set_path(shp_path))
+    bordergeo.attach_field_index(sf)
+
+    # `codes.cia.csv` and `codes.manual.csv` together.
+    lines = [u"; ".join(row) for row in results["codes.cia"]]
+    with codecs.open(set_path(codes_path), "r", "utf-8") as csv_file:
+        lines += csv_file.readlines()
+    iso32 = bordergeo.get_iso32(lines)
+
+    with codecs.open(set_path(switch_path), "r", "utf-8") as csv_file:
+        border_switch = bordergeo.get_border(csv_file, is_dict=True)
+    with codecs.open(set_path(deny_path), "r", "utf-8") as csv_file:
+        border_deny = bordergeo.get_border(csv_file)
+
+    geometry = bordergeo.shp2geo(sf, iso32, border_switch, border_deny)
+    write_geo(set_path(stage.outputs[0]), set_path(stage.outputs[1]), geometry)
+
+
+
+def missing_geo_stage(stage, results):
+    import missinggeo
+    geometry = missinggeo.csv2geo(set_path(stage.sources[0]))
+    write_geo(set_path(stage.outputs[0]), set_path(stage.outputs[1]), geometry)
+
+
+
+def world_points_stage(stage, results):
+    import geometry
+    import landpoints
+    land = geometry.load(set_path(STAGE_INDEX[stage.depends[0]].outputs[1]))
+    missing = geometry.load(set_path(STAGE_INDEX["missing.geo"].outputs[1]))
+    geo = landpoints.land_points(land, missing)
+    write_geo(set_path(stage.outputs[0]), set_path(stage.outputs[1]), geo)
+
+
+
+def border_points_stage(stage, results):
+    import geometry
+    import borderpoints
+    border = geometry.load(set_path(STAGE_INDEX[stage.depends[0]].outputs[1]))
+    geo = borderpoints.border_points(border)
+    write_geo(set_path(stage.outputs[0]), set_path(stage.outputs[1]), geo)
+
+
+
+def simplify_stage(stage, results):
+    import geometry
+    import simplify
+    source = geometry.load(set_path(STAGE_INDEX[stage.depends[0]].outputs[1]))
+    geo = simplify.simplify(source, SETTINGS["tolerance"], jobs=SETTINGS["jobs"])
+    write_geo(set_path(stage.outputs[0]), set_path(stage.outputs[1]), geo)
+
+
+
+def dots_stage(stage, results):
+    import geometry
+    import dotsbin
+    import compile_json
+
+    land = geometry.load(set_path(STAGE_INDEX["world-3d-points.geo"].outputs[1]))
+    border = geometry.load(set_path(STAGE_INDEX["border-3d-points.geo"].outputs[1]))
+    names = dict((row[0], row[1]) for row in results["names"])
+    groups = dict((row[0], row[1]) for row in results["groups"])
+    populations = dict((row[0], int(row[1])) for row in results["population"])
+
+    data = compile_json.compile_data(land, border, names, groups, populations)
+
+    def write_json(tmp_path):
+        with open(tmp_path, "w") as json_file:
+            json.dump(data, json_file, indent=2)
+
+    def write_binary(tmp_path):
+        with open(tmp_path, "wb") as binary_file:
+            dotsbin.dump_dots(binary_file, data)
+
+    replace(set_path(stage.outputs[0]), write_json)
+    replace(set_path(stage.outputs[1]), write_binary)
+
+
+
+class Stage(object):
+    def __init__(self, name, function, outputs, sources=(), depends=(),
+                 modules=(), settings=(), local=False, load=load_none):
+        self.name = name
+        self.function = function
+        self.outputs = list(outputs)
+        self.sources = list(sources)
+        self.depends = list(depends)
+        self.modules = list(modules)
+        self.settings = list(settings)
+        self.local = local
+        self.load = load
+
+    def __repr__(self):
+        return "<Stage %s>" % self.name
+
+
+
+STAGES = [
+    Stage("names", names_stage,
+          ["data/csv/names.csv"],
+          sources=["sources/iso/1.short.en.csv"],
+          load=load_csv),
+    Stage("codes.cia", codes_cia_stage,
+          ["data/csv/codes.cia.csv"],
+          sources=["sources/cia/country-data-codes.html"],
+          modules=["cia_codes"], load=load_csv),
+    Stage("codes", combine_stage,
+          ["data/csv/codes.csv"],
+          sources=["data/csv/codes.manual.csv"],
+          depends=["names", "codes.cia"],
+          modules=["combine"], load=load_csv),
+    Stage("population.cia", population_cia_stage,
+          ["data/csv/population.cia.csv"],
+          sources=["sources/cia/population.text"],
+          depends=["codes.cia"],
+          modules=["cia_population"], load=load_csv),
+    Stage("population", combine_stage,
+          ["data/csv/population.csv"],
+          sources=["data/csv/population.manual.csv"],
+          depends=["names", "population.cia"],
+          modules=["combine"], load=load_csv),
+    Stage("groups", combine_stage,
+          ["data/csv/groups.csv"],
+          sources=["data/csv/groups.manual.csv"],
+          depends=["names", "world.geo"],
+          modules=["combine"], load=load_csv),
+    Stage("world.geo", world_geo_stage,
+          ["data/geo/world.geo", "data/geo/world.npgeo",
+           "data/csv/names.ne.csv", "data/csv/groups.ne.csv"],
+          sources=shapefile_paths(COUNTRY),
+          modules=["worldgeo", "world2group", "dbf", "shpingest", "shpreader", "topology", "geometry"],
+          load=load_world),
+    Stage("border.geo", border_geo_stage,
+          ["data/geo/border.geo", "data/geo/border.npgeo"],
+          sources=shapefile_paths(BORDER_LAND) + [
+              "data/csv/codes.manual.csv",
+              "data/csv/borders-switch.manual.csv",
+              "data/csv/borders-deny.manual.csv",
+          ],
+          depends=["codes.cia"],
+          modules=["bordergeo", "shpingest", "shpreader", "topology", "geometry"]),
+    Stage("missing.geo", missing_geo_stage,
+          ["data/geo/missing.geo", "data/geo/missing.npgeo"],
+          sources=["data/csv/landmass-latlon.manual.csv"],
+          modules=["missinggeo", "geometry"]),
+    Stage("world-simple.geo", simplify_stage,
+          ["data/geo/world-simple.geo", "data/geo/world-simple.npgeo"],
+          depends=["world.geo"],
+          modules=["simplify", "measure", "topology", "geometry"],
+          settings=["tolerance"], local=True),
+    Stage("border-simple.geo", simplify_stage,
+          ["data/geo/border-simple.geo", "data/geo/border-simple.npgeo"],
+          depends=["border.geo"],
+          modules=["simplify", "measure", "topology", "geometry"],
+          settings=["tolerance"], local=True),
+    Stage("world-3d-points.geo", world_points_stage,
+          ["data/geo/world-3d-points.geo", "data/geo/world-3d-points.npgeo"],
+          depends=["world.geo", "missing.geo"],
+          modules=["landpoints", "measure", "geometry"]),
+    Stage("border-3d-points.geo", border_points_stage,
+          ["data/geo/border-3d-points.geo", "data/geo/border-3d-points.npgeo"],
+          depends=["border.geo"],
+          modules=["borderpoints", "measure", "geometry"]),
+    Stage("dots.json", dots_stage,
+          ["data/json/dots.json", "data/json/dots.bin"],
+          depends=["world-3d-points.geo", "border-3d-points.geo",
+                   "names", "groups", "population"],
+          modules=["compile_json", "dotsbin", "geometry"]),
+]
+
+STAGE_INDEX = dict((stage.name, stage) for stage in STAGES)
+
+
+
+def configure(tolerance=None, jobs=None):
+    # With a tolerance, the point stages read simplified geometry.
+    SETTINGS["tolerance"] = tolerance
+    SETTINGS["jobs"] = jobs
+    if tolerance is not None:
+        STAGE_INDEX["world-3d-points.geo"].depends[0] = "world-simple.geo"
+        STAGE_INDEX["border-3d-points.geo"].depends[0] = "border-simple.geo"
+
+
+
+def enabled(stage):
+    return all(SETTINGS[name] is not None for name in stage.settings)
+
+
+
+# Hashing
+
+
+
+def hash_file(path, h):
+    with open(path, "rb") as fp:
+        while True:
+            chunk = fp.read(1 << 20)
+            if not chunk:
+                break
+            h.update(chunk)
+
+
+
+def stage_key(stage, keys, file_hashes):
+    # Hash of everything a stage's output depends on: its sources, the
+    # code that makes it and the keys of the stages it reads from.
+    h = hashlib.sha1()
+    h.update(stage.name)
+    paths = [os.path.abspath(__file__)] + [
+        os.path.realpath(os.path.join(CODE_PATH, module + ".py"))
+        for module in stage.modules
+    ] + [set_path(path) for path in stage.sources]
+    for path in paths:
+        if path not in file_hashes:
+            file_hash = hashlib.sha1()
+            hash_file(path, file_hash)
+            file_hashes[path] = file_hash.hexdigest()
+        h.update(file_hashes[path])
+    for name in stage.depends:
+        h.update(keys[name])
+    for name in stage.settings:
+        h.update(json.dumps(SETTINGS[name]))
+    return h.hexdigest()
+
+
+
+def read_state():
+    if not os.path.exists(STATE_PATH):
+        return {}
+    with open(STATE_PATH) as state_file:
+        return json.load(state_file)
+
+
+
+def write_state(state):
+    def write(tmp_path):
+        with open(tmp_path, "w") as state_file:
+            json.dump(state, state_file, indent=2, sort_keys=True)
+    replace(STATE_PATH, write)
+
+
+
+# Running
+
+
+
+def run_stage(name, results):
+    start = time.time()
+    stage = STAGE_INDEX[name]
+    result = stage.function(stage, results)
+    return result, time.time() - start
+
+
+
+class LocalResult(object):
+    # A stage run in this process, with the interface of the `AsyncResult`
+    # of one run in the pool.
+    def __init__(self, name, results):
+        self.error = None
+        try:
+            self.value = run_stage(name, results)
+        except Exception as e:
+            self.error = e
+
+    def ready(self):
+        return True
+
+    def get(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+
+def required(targets):
+    names = set()
+    queue = list(targets)
+    while queue:
+        name = queue.pop()
+        if name in names:
+            continue
+        names.add(name)
+        queue += STAGE_INDEX[name].depends
+    return [stage for stage in STAGES if stage.name in names]
+
+
+
+def pipeline(targets=None, jobs=None, force=False, tolerance=None):
+    configure(tolerance, jobs)
+    stages = required(targets or [stage.name for stage in STAGES if enabled(stage)])
+    disabled = [stage.name for stage in stages if not enabled(stage)]
+    if disabled:
+        log.error("Stages need more options: %s" % ", ".join(disabled))
+        return False
+    state = read_state()
+    file_hashes = {}
+    keys = {}
+    results = {}
+    pending = list(stages)
+    running = {}
+    local = []
+    failed = []
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        while pending or running:
+            # Start, or skip, every stage whose inputs are ready.
+            progress = True
+            while progress and not failed:
+                progress = False
+                for stage in list(pending):
+                    if not all(name in results for name in stage.depends):
+                        continue
+                    pending.remove(stage)
+                    progress = True
+                    keys[stage.name] = stage_key(stage, keys, file_hashes)
+                    outputs_exist = all(os.path.exists(set_path(path)) for path in stage.outputs)
+                    if not force and outputs_exist and state.get(stage.name) == keys[stage.name]:
+                        log.info("%-22s unchanged" % stage.name)
+                        results[stage.name] = stage.load(stage)
+                        continue
+                    log.info("%-22s start" % stage.name)
+                    if stage.local:
+                        local.append(stage)
+                        continue
+                    running[stage.name] = pool.apply_async(run_stage, (
+                        stage.name,
+                        dict((name, results[name]) for name in stage.depends),
+                    ))
+
+            # Stages that start pools of their own run here, once every other
+            # ready stage is running, as pool workers cannot start pools.
+            for stage in local:
+                running[stage.name] = LocalResult(
+                    stage.name, dict((name, results[name]) for name in stage.depends))
+            local = []
+
+            if not running:
+                break
+
+            for name, async_result in running.items():
+                if not async_result.ready():
+                    continue
+                del running[name]
+                try:
+                    result, duration = async_result.get()
+                except Exception as e:
+                    log.error("%-22s failed: %s" % (name, e))
+                    failed.append(name)
+                    state.pop(name, None)
+                    continue
+                log.info("%-22s done in %.2fs" % (name, duration))
+                results[name] = result
+                state[name] = keys[name]
+                write_state(state)
+
+            time.sleep(0.01)
+    finally:
+        pool.close()
+        pool.join()
+
+    if failed:
+        write_state(state)
+        log.error("Failed: %s" % ", ".join(failed))
+        return False
+    return True
+
+
+
+def main():
+    logging.getLogger().addHandler(logging.StreamHandler())
+
+    usage = """%%prog [STAGE...]
+
+STAGE   Stages to build, with the stages they depend on. Default is all:
+        %s
+""" % ", ".join(stage.name for stage in STAGES)
+
+    parser = OptionParser(usage=usage)
+    parser.add_option("-v", "--verbose", action="count", dest="verbose",
+                      help="Print verbose information for debugging.", default=0)
+    parser.add_option("-q", "--quiet", action="count", dest="quiet",
+                      help="Suppress warnings.", default=0)
+    parser.add_option("-j", "--jobs", action="store", dest="jobs", type="int",
+                      help="Worker processes. Default is one per core.", default=None)
+    parser.add_option("-f", "--force", action="store_true", dest="force",
+                      help="Run stages even if their inputs are unchanged.", default=False)
+    parser.add_option("-t", "--tolerance", action="store", dest="tolerance", type="float",
+                      help="Simplify world and border geometry to this tolerance in degrees.", default=None)
+
+    (options, args) = parser.parse_args()
+
+    log_level = (logging.ERROR, logging.WARNING, logging.INFO, logging.DEBUG,)[
+        max(0, min(3, 1 + options.verbose - options.quiet))]
+
+    logging.getLogger().setLevel(log_level)
+
+    unknown = [name for name in args if name not in STAGE_INDEX]
+    if unknown:
+        log.error("Unknown stage: %s" % ", ".join(unknown))
+        parser.print_usage()
+        sys.exit(1)
+
+    if not pipeline(args, options.jobs, options.force, options.tolerance):
+        sys.exit(1)
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+../../../code/shpingest.py
\ No newline at end of file
@@ -0,0 +1 @@
+../../../code/shpreader.py
\ No newline at end of file
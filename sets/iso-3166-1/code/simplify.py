@@ -0,0 +1 @@
+../../../code/simplify.py
\ No newline at end of file
@@ -0,0 +1 @@
+../../../code/topology.py
\ No newline at end of file
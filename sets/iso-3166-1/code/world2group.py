@@ -4,15 +4,13 @@
 import sys
 import logging
 from optparse import OptionParser
-from collections import defaultdict
 
-import shapefile
-
-from geometry import Geometry
+import dbf
 
 
 
 DELIMITER = u";"
+GROUP_FIELDS = ("ISO_A2", "ADMIN", "SUBREGION", "REGION_UN", "REGION_WB")
 
 
 
@@ -20,44 +18,52 @@ log = logging.getLogger('world2group')
 
 
 
-def world2group(shp_path):
-    log.info(shp_path)
-    sf = shapefile.Reader(shp_path)
+def country_group(country):
+    # `[iso2, group, admin]` for a country, or `None` if it has no code or
+    # is not in a group.
+    if country["ISO_A2"] == "-99":
+        return None
+
+    group = country["REGION_UN"]
+
+    if country["SUBREGION"] == "Caribbean":
+        group = "Caribbean"
 
-    field_names = [field[0] for field in sf.fields[1:]]
+    if group == "Asia" and country["REGION_WB"] == "Middle East & North Africa":
+        group = "Middle East"
 
-    for record in sf.records():
-        for i, value in enumerate(record):
-            if isinstance(value, str):
-                record[i] = value.decode("utf-8")
-         
-        country = dict(zip(field_names, record))
-        if country["ISO_A2"] == "-99":
-            continue
+    if group in ("Europe", "Asia"):
+        group = "Eurasia"
 
-        group = country["REGION_UN"]
-        
-        if country["SUBREGION"] == "Caribbean":
-            group = "Caribbean"
+    if group == "Seven seas (open ocean)":
+        return None
 
-        if group == "Asia" and country["REGION_WB"] == "Middle East & North Africa":
-            group = "Middle East"
+    row = [
+        country["ISO_A2"],
+        group,
+        country["ADMIN"],
+        ]
 
-        if group in ("Europe", "Asia"):
-            group = "Eurasia"
+    for value in row:
+        assert DELIMITER not in value
 
-        if group == "Seven seas (open ocean)":
-            continue
+    return row
 
-        row = [
-            country["ISO_A2"],
-            group,
-            country["ADMIN"],
-            ]
 
-        for value in row:
-            assert DELIMITER not in value
 
+def world_groups(shp_path):
+    # `[iso2, group, admin]` rows for each country in the shapefile, from
+    # its attribute table alone.
+    log.info(shp_path)
+    for values in dbf.rows(shp_path, GROUP_FIELDS):
+        row = country_group(dict(zip(GROUP_FIELDS, values)))
+        if row:
+            yield row
+
+
+
+def world2group(shp_path):
+    for row in world_groups(shp_path):
         sys.stdout.write((
             (DELIMITER + u" ").join(row) + "\n"
         ).encode("utf-8"))
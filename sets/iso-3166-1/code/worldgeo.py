@@ -4,11 +4,14 @@
 import sys
 import logging
 from optparse import OptionParser
-from collections import defaultdict
 
 import shapefile
 
-from geometry import Geometry
+import dbf
+from geometry import ArrayGeometry
+from shpingest import PRECISION, iter_shape_rings, add_rings
+from topology import set_freq
+from world2group import GROUP_FIELDS, country_group
 
 
 
@@ -20,70 +23,72 @@ log = logging.getLogger('worldgeo')
 
 
 
-def dump_csv(sf):
-    row_targets = ("ISO_A2", "ADMIN", "SUBREGION")
-    row_target_ids = [sf.get_field(name) for name in row_targets]
-    for record in sf.records():
-        values = [record[id_].decode("utf-8") for id_ in row_target_ids]
-        if values[0] == u"-99":
-            continue
+NAME_FIELDS = ("ISO_A2", "ADMIN", "SUBREGION")
 
-        for value in values:
-            assert DELIMITER not in value
-        sys.stdout.write((
-            (DELIMITER + u" ").join(values) + "\n"
+
+
+def name_row(country):
+    # `[iso2, admin, subregion]` for a country, or `None` if it has no code.
+    row = [country[name] for name in NAME_FIELDS]
+    if row[0] == u"-99":
+        return None
+
+    for value in row:
+        assert DELIMITER not in value
+
+    return row
+
+
+
+def write_rows(out, rows):
+    for row in rows:
+        out.write((
+            (DELIMITER + u" ").join(row) + "\n"
         ).encode("utf-8"))
 
 
 
-def trunc(f, n=6):
-    m = 10**n
-    return float(int(f * m + float(cmp(f, 0))*.5)) / m
+def dump_csv(shp_path):
+    rows = (name_row(dict(zip(NAME_FIELDS, values)))
+            for values in dbf.rows(shp_path, NAME_FIELDS))
+    write_rows(sys.stdout, (row for row in rows if row))
 
 
 
-def shp2geo(sf):
-    geometry = Geometry()
-    index_admin = sf.get_field("ADMIN")
+def ingest(sf, precision=PRECISION):
+    # Geometry, name rows and group rows from one pass over the records
+    # and shapes.
+    geometry = ArrayGeometry()
+    country_fields = [(name, sf.get_field(name))
+                      for name in sorted(set(NAME_FIELDS + GROUP_FIELDS))]
     index_iso2 = sf.get_field("ISO_A2")
+    names = []
+    groups = []
 
     p = 0
-    for s, shaperecord in enumerate(sf.records()):
-        shaperecord = sf.shapeRecord(s)
-        admin = shaperecord.record[index_admin]
-        iso2 = shaperecord.record[index_iso2]
-
-        parts = shaperecord.shape.parts
-        part_shapes = []
-        for i, point in enumerate(shaperecord.shape.points):
-            if i in parts:
-                part_shapes.append([])
-            part_shapes[-1].append(point)
-        p += len(part_shapes)
-        for part_shape in part_shapes:
-            point_numbers = []
-            for point in part_shape[:-1]:  # because it's closed
-                point_number = geometry.add_point(trunc(point[0]), trunc(point[1]), 0.0)
-                point_numbers.append(point_number)
-            prim_number = geometry.add_prim(point_numbers)
-            
+    for s, record, rings in iter_shape_rings(sf):
+        country = dict((name, record[i].decode("utf-8")) for name, i in country_fields)
+        for rows, row in ((names, name_row(country)), (groups, country_group(country))):
+            if row:
+                rows.append(row)
+
+        iso2 = record[index_iso2]
+
+        p += len(rings)
+        for prim_number in add_rings(geometry, rings, precision=precision):
             geometry.set_prim_attr_string('iso2', prim_number, iso2)
             geometry.set_prim_attr_int('prim', prim_number, prim_number)
     log.warning(repr((s, p)))
 
-    d = defaultdict(int)
-    for p, point in enumerate(geometry.points):
-        d[point] += 1
-    for p, point in enumerate(geometry.points):
-        geometry.set_point_attr_int('freq', p, d[point])
-    
-    return geometry
+    set_freq(geometry, precision)
 
+    return geometry, names, groups
 
 
-def dump_geo(sf):
-    geometry = shp2geo(sf)
-    print geometry.render()
+
+def shp2geo(sf, precision=PRECISION):
+    geometry, names, groups = ingest(sf, precision)
+    return geometry
 
 
 
@@ -95,16 +100,25 @@ def attach_field_index(sf):
 
 
 
-def worldgeo(shp_path, dump=None):
+def worldgeo(shp_path, dump=None, binary_path=None, precision=PRECISION,
+             names_path=None, groups_path=None):
     log.info(shp_path)
-    sf = shapefile.Reader(shp_path)
-    attach_field_index(sf)
 
     if dump:
-        dump_csv(sf)
+        dump_csv(shp_path)
         return
 
-    dump_geo(sf)
+    sf = shapefile.Reader(shp_path)
+    attach_field_index(sf)
+
+    geometry, names, groups = ingest(sf, precision)
+    geometry.write(sys.stdout)
+    if binary_path:
+        geometry.save(binary_path)
+    for path, rows in ((names_path, names), (groups_path, groups)):
+        if path:
+            with open(path, "w") as csv_file:
+                write_rows(csv_file, rows)
 
 
 
@@ -123,6 +137,14 @@ SHP    World admin shapefile.
                       help="Suppress warnings.", default=0)
     parser.add_option("-l", "--list", action="store_true", dest="dump",
                       help="List countries as CSV of iso2, name.", default=None)
+    parser.add_option("-b", "--binary", action="store", dest="binary",
+                      help="Also save geometry to a binary sidecar at this path.", default=None)
+    parser.add_option("-p", "--precision", action="store", dest="precision", type="int",
+                      help="Decimal places to round coordinates to. Default %d." % PRECISION, default=PRECISION)
+    parser.add_option("-n", "--names", action="store", dest="names",
+                      help="Also write the `--list` CSV to this path.", default=None)
+    parser.add_option("-g", "--groups", action="store", dest="groups",
+                      help="Also write the `world2group.py` CSV to this path.", default=None)
 
     (options, args) = parser.parse_args()
     args = [arg.decode(sys.getfilesystemencoding()) for arg in args]
@@ -138,7 +160,8 @@ SHP    World admin shapefile.
 
     (shp_path, ) = args
 
-    worldgeo(shp_path, options.dump)
+    worldgeo(shp_path, options.dump, options.binary, options.precision,
+             options.names, options.groups)
     
     
 